@@ -0,0 +1,379 @@
+"""Adaptive passage selection aimed at a player's weak keys and bigrams.
+
+NgramIndex maps every character and bigram to the passages containing it,
+densest first, so choosing a passage is a few binary searches and one
+bincount over the postings of the player's weakest n-grams instead of a
+scan of the text. For a corpus file the index is written once next to it
+(<corpus>.ngrams.npy and <corpus>.postings.npy) and memory-mapped.
+
+Weak n-grams come from TypingAnalytics.weakness (see analytics.py), with
+the same n-gram ids: a codepoint for a key, prev << 21 | cur for a bigram.
+
+    python adaptive.py index passages.txt
+    python adaptive.py pick typing_sessions --corpus passages.txt --player Asha
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+from analytics import TypingAnalytics
+from corpus import Corpus, CorpusError, index_is_current, build_index, _corpus_signature
+
+CP_BITS = 21
+_PASSAGE_SHIFT = np.uint64(2 * CP_BITS)
+_NGRAM_MASK = np.uint64((1 << 2 * CP_BITS) - 1)
+_DENSITY_BITS = 64 - 2 * CP_BITS
+_DENSITY_STEPS = np.uint64((1 << _DENSITY_BITS) - 1)
+
+NGRAM_DTYPE = np.dtype([("ngram", "<u8"), ("start", "<u8")])
+POSTING_DTYPE = np.dtype([("passage", "<u4"), ("density", "<f4")])
+
+# Postings kept per n-gram; the densest passages are the useful ones
+MAX_POSTINGS = 4096
+# Densest postings per n-gram scored on the first try; widened (up to
+# MAX_POSTINGS) only when the filters reject all of them
+SCAN_POSTINGS = 256
+# Passages scanned per build step
+BUILD_CHUNK = 8192
+# The pick is random among this many best-scoring passages
+TOP_CHOICES = 8
+
+
+def _ngrams(codepoints):
+    """(unigram ids, bigram ids, bigram mask) of a codepoint array; 0 separates passages"""
+    cps = codepoints.astype(np.uint64)
+    pairs = (cps[:-1] << np.uint64(CP_BITS)) | cps[1:]
+    keep = (cps[:-1] != 0) & (cps[1:] != 0)
+    return cps[cps != 0], pairs[keep], keep
+
+
+def _chunk_postings(texts, first):
+    """(passage << 42 | ngram, density) for each distinct n-gram of each passage"""
+    cps = np.frombuffer("\0".join(texts).encode("utf-32-le"), dtype="<u4")
+    passage = np.cumsum(cps == 0, dtype=np.uint64) + np.uint64(first)
+    unigrams, bigrams, keep = _ngrams(cps)
+    keys = np.concatenate((
+        (passage[cps != 0] << _PASSAGE_SHIFT) | unigrams,
+        (passage[1:][keep] << _PASSAGE_SHIFT) | bigrams,
+    ))
+    keys, counts = np.unique(keys, return_counts=True)
+    lengths = np.maximum(np.fromiter((len(t) for t in texts), dtype=np.float32, count=len(texts)), 1)
+    return keys, counts / lengths[(keys >> _PASSAGE_SHIFT) - np.uint64(first)]
+
+
+def _sort_key(ngrams, density):
+    """n-gram << 22 | quantized density, inverted so denser sorts first"""
+    rank = _DENSITY_STEPS - np.minimum(density * float(_DENSITY_STEPS), float(_DENSITY_STEPS)).astype(np.uint64)
+    return (ngrams << np.uint64(_DENSITY_BITS)) | rank
+
+
+def _merge_postings(keys, passages, new_keys, new_passages):
+    """Merge a chunk into the sorted postings, keeping MAX_POSTINGS per n-gram"""
+    order = np.argsort(new_keys)
+    new_keys, new_passages = new_keys[order], new_passages[order]
+    at = np.searchsorted(keys, new_keys)
+    keys = np.insert(keys, at, new_keys)
+    passages = np.insert(passages, at, new_passages)
+    ngrams = keys >> np.uint64(_DENSITY_BITS)
+    starts = np.flatnonzero(np.r_[True, ngrams[1:] != ngrams[:-1]])
+    rank = np.arange(len(keys)) - np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+    keep = rank < MAX_POSTINGS
+    return keys[keep], passages[keep]
+
+
+class NgramIndex:
+    """N-gram -> passage postings, from memory or a memory-mapped file"""
+
+    def __init__(self, ngrams, postings):
+        self.ngrams = ngrams
+        self.postings = postings
+
+    @classmethod
+    def build(cls, texts):
+        """Index an iterable of passages; passage ids are their positions"""
+        keys = np.empty(0, dtype=np.uint64)
+        passages = np.empty(0, dtype=np.uint32)
+        first = 0
+        texts = iter(texts)
+        while True:
+            chunk = [t for _, t in zip(range(BUILD_CHUNK), texts)]
+            if not chunk:
+                break
+            chunk_keys, density = _chunk_postings(chunk, first)
+            first += len(chunk)
+            keys, passages = _merge_postings(
+                keys, passages, _sort_key(chunk_keys & _NGRAM_MASK, density),
+                (chunk_keys >> _PASSAGE_SHIFT).astype(np.uint32))
+        ngrams = keys >> np.uint64(_DENSITY_BITS)
+        uniq, starts = np.unique(ngrams, return_index=True)
+        table = np.empty(len(uniq) + 1, dtype=NGRAM_DTYPE)
+        table["ngram"][:-1] = uniq
+        table["start"][:-1] = starts
+        table[-1] = (np.iinfo(np.uint64).max, len(ngrams))
+        postings = np.empty(len(ngrams), dtype=POSTING_DTYPE)
+        postings["passage"] = passages
+        postings["density"] = (_DENSITY_STEPS - (keys & _DENSITY_STEPS)) / float(_DENSITY_STEPS)
+        return cls(table, postings)
+
+    @classmethod
+    def load(cls, path):
+        ngrams, postings = _index_paths(path)
+        return cls(np.load(ngrams, mmap_mode="r"), np.load(postings, mmap_mode="r"))
+
+    def save(self, path):
+        for target, array in zip(_index_paths(path), (self.ngrams, self.postings)):
+            tmp = target + ".tmp.npy"
+            np.save(tmp, array)
+            os.replace(tmp, target)
+
+    def scores(self, weights, size):
+        """Weighted n-gram density per passage for {n-gram id: weight}"""
+        dense = np.zeros(size)
+        passages, scores = self.sparse_scores(weights)
+        dense[passages] = scores
+        return dense
+
+    def sparse_scores(self, weights, limit=None):
+        """(passage ids, scores) over the first limit postings of each weighted n-gram.
+
+        Work depends on the number of n-grams and postings read, not on the
+        corpus size.
+        """
+        if not weights:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ids = np.fromiter(weights, dtype=np.uint64, count=len(weights))
+        w = np.fromiter(weights.values(), dtype=np.float64, count=len(weights))
+        table = self.ngrams["ngram"]
+        pos = np.searchsorted(table[:-1], ids)
+        hit = pos < len(table) - 1
+        hit[hit] = table[pos[hit]] == ids[hit]
+        starts = self.ngrams["start"]
+        passages, values = [], []
+        for p, weight in zip(pos[hit], w[hit]):
+            start, end = int(starts[p]), int(starts[p + 1])
+            if limit is not None:
+                end = min(end, start + limit)
+            block = self.postings[start:end]
+            passages.append(block["passage"])
+            values.append(block["density"] * weight)
+        if not passages:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        passages, inverse = np.unique(np.concatenate(passages), return_inverse=True)
+        return passages.astype(np.int64), np.bincount(inverse, weights=np.concatenate(values))
+
+
+def _index_paths(path):
+    return path + ".ngrams.npy", path + ".postings.npy"
+
+
+def _signature_path(path):
+    return path + ".ngrams.json"
+
+
+def ngram_index_is_current(path):
+    try:
+        with open(_signature_path(path)) as f:
+            return json.load(f) == _corpus_signature(path) and all(map(os.path.exists, _index_paths(path)))
+    except (OSError, ValueError):
+        return False
+
+
+def build_ngram_index(corpus):
+    index = NgramIndex.build(corpus.passage(i) for i in range(len(corpus)))
+    index.save(corpus.path)
+    with open(_signature_path(corpus.path), "w") as f:
+        json.dump(_corpus_signature(corpus.path), f)
+    return index
+
+
+def pick(rng, ids, scores, eligible):
+    """Random choice among the ids with the TOP_CHOICES best positive scores, or None"""
+    if not len(scores):
+        return None
+    scores = np.where(eligible, scores, 0)
+    top = np.argpartition(-scores, min(TOP_CHOICES, len(scores) - 1))[:TOP_CHOICES]
+    top = top[scores[top] > 0]
+    if not len(top):
+        return None
+    return int(ids[top[rng.randrange(len(top))]])
+
+
+class AdaptivePassages:
+    """Passage source that favours a player's weak keys and bigrams.
+
+    With a corpus it picks the best-matching passage for the usual
+    length/charset filters; without one (or while the corpus n-gram index is
+    still building on its own thread) it generates a passage from a word
+    list. It has the Corpus.select signature so PassagePrefetcher can drive
+    it; pass player=<name> with the criteria.
+
+    analytics is a TypingAnalytics, or a callable returning one that the
+    first refresh() calls, so its saved state loads off the caller's thread.
+    """
+
+    def __init__(self, analytics, corpus=None, vocabulary=()):
+        self.analytics = analytics
+        self.corpus = corpus
+        self.index = None
+        self.index_thread = None
+        self.words = sorted(set(vocabulary))
+        # Leading space so word-initial bigrams like ' q' count too
+        self.word_index = NgramIndex.build(" " + word for word in self.words)
+        self.lock = threading.Lock()
+        self.weights = {}
+
+    def refresh(self):
+        """Fold new sessions into the analytics (and start loading the corpus index on first use)"""
+        with self.lock:
+            try:
+                if callable(self.analytics):
+                    self.analytics = self.analytics()
+                if self.analytics.ingest() != (0, 0):
+                    self.weights = {}
+                    self.analytics.save()
+            except (OSError, ValueError) as e:
+                print(f"Could not update typing analytics: {e}")
+        if self.corpus is not None and self.index is None and self.index_thread is None:
+            # Not on the caller's thread: building the index of a large corpus
+            # takes seconds, and picks meanwhile fall back to generate()
+            self.index_thread = threading.Thread(target=self.load_index, name="ngram-index", daemon=True)
+            self.index_thread.start()
+
+    def load_index(self):
+        """Load the corpus n-gram index, building it first if it is stale"""
+        try:
+            if ngram_index_is_current(self.corpus.path):
+                index = NgramIndex.load(self.corpus.path)
+            else:
+                index = build_ngram_index(self.corpus)
+        except OSError as e:
+            print(f"Adaptive corpus selection disabled: {e}")
+            index = None
+        with self.lock:
+            self.index = index
+
+    def weakness(self, player):
+        if callable(self.analytics):
+            return {}
+        if player not in self.weights:
+            self.weights[player] = self.analytics.weakness(player)
+        return self.weights[player]
+
+    def select(self, rng=random, exclude=(), player=None, **criteria):
+        """(passage id or None, text) aimed at player's weak spots, or None without data"""
+        used = [i for i in exclude if i is not None]
+        with self.lock:
+            weights = self.weakness(player)
+            if not weights:
+                return self.corpus.select(rng, used, **criteria) if self.corpus is not None else None
+            if self.index is not None:
+                limit = SCAN_POSTINGS
+                while True:
+                    ids, scores = self.index.sparse_scores(weights, limit)
+                    eligible = self.corpus.matches(ids, **criteria)
+                    if used:
+                        eligible &= ~np.isin(ids, used)
+                    i = pick(rng, ids, scores, eligible)
+                    if i is not None:
+                        return i, self.corpus.passage(i)
+                    if limit >= MAX_POSTINGS:
+                        break
+                    limit *= 4
+            return self.generate(rng, weights, criteria.get("min_len", 20), criteria.get("max_len", 60))
+
+    def generate_now(self, rng=random, player=None, min_len=20, max_len=60, **criteria):
+        """generate() from weights already computed, without waiting for the lock.
+
+        For when a pick from the worker is late; None if the player's
+        weights have not been computed yet.
+        """
+        weights = self.weights.get(player)
+        if not weights:
+            return None
+        return self.generate(rng, weights, min_len, max_len)
+
+    def generate(self, rng, weights, min_len, max_len):
+        """(None, text) of words drawn in proportion to their weak n-gram density"""
+        if not self.words:
+            return None
+        scores = self.word_index.scores(weights, len(self.words))
+        if not scores.any():
+            return None
+        p = scores + 0.05 * scores.max()
+        cumulative = np.cumsum(p / p.sum())
+        words = []
+        length = -1
+        for _ in range(50):
+            word = self.words[min(int(np.searchsorted(cumulative, rng.random())), len(self.words) - 1)]
+            if length + 1 + len(word) > max_len:
+                if length >= min_len:
+                    break
+                continue
+            words.append(word)
+            length += 1 + len(word)
+        if not words:
+            return None
+        text = " ".join(words)
+        return None, text[0].upper() + text[1:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Adaptive passage selection tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("index", help="build the n-gram index for a corpus file")
+    p.add_argument("path")
+    p = sub.add_parser("pick", help="pick passages for a player's weak keys and bigrams")
+    p.add_argument("sessions_dir")
+    p.add_argument("--corpus")
+    p.add_argument("--player")
+    p.add_argument("--min-len", type=int, default=40)
+    p.add_argument("--max-len", type=int, default=55)
+    p.add_argument("-n", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "index" or args.corpus:
+            path = args.path if args.command == "index" else args.corpus
+            if not index_is_current(path):
+                build_index(path)
+            corpus = Corpus(path)
+            if args.command == "index":
+                start = time.perf_counter()
+                index = build_ngram_index(corpus)
+                print(f"Indexed {len(index.ngrams) - 1} n-grams over {len(corpus)} passages "
+                      f"in {time.perf_counter() - start:.1f} s")
+                return 0
+        else:
+            corpus = None
+    except (OSError, CorpusError) as e:
+        print(e)
+        return 1
+
+    source = AdaptivePassages(TypingAnalytics(args.sessions_dir), corpus)
+    if corpus is not None:
+        source.load_index()
+    source.refresh()
+    if not source.weakness(args.player):
+        print("No weak keys yet; play a few levels first")
+        return 0
+    used = set()
+    for _ in range(args.n):
+        start = time.perf_counter()
+        result = source.select(random, used, player=args.player, min_len=args.min_len, max_len=args.max_len)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result is None:
+            print("No matching passages")
+            break
+        used.add(result[0])
+        print(f"[{elapsed:.1f} ms] {result[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,387 @@
+"""Cohort typing analytics over recorded keystroke logs.
+
+The game appends every attempt to <sessions dir>/keystrokes-<host>.bin
+(fixed-size records, see keylog.RECORD) and sessions-<host>.jsonl
+(one metadata line per attempt). TypingAnalytics reads only what was
+appended since the last run and folds it into saved aggregates with
+batched NumPy operations:
+
+  * per-key attempts, errors and latency, per player and overall
+  * per-bigram latency histograms and error rates, per player and overall
+  * WPM over time per (player, difficulty)
+
+    python analytics.py report typing_sessions
+    python analytics.py report typing_sessions --player Asha --top 15
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import uuid
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([
+    ("session", "<u8"),
+    ("key", "<u4"),
+    ("expected", "<u4"),
+    ("t", "<f8"),
+    ("correct", "i1"),
+])
+
+# Gaps longer than this are pauses, not typing latency
+PAUSE = 2.0
+# Latency histogram: 20 ms .. 2 s, log spaced, plus under/overflow bins
+LATENCY_EDGES = np.concatenate(([0.0], np.geomspace(0.02, PAUSE, 31), [np.inf]))
+N_BINS = len(LATENCY_EDGES) - 1
+
+ALL_PLAYERS = 0
+_CP_BITS = 21
+_CP_MASK = (1 << _CP_BITS) - 1
+
+STATE_FILE = "analytics_state.npz"
+
+
+def key_id(player, codepoint):
+    return (np.uint64(player) << np.uint64(32)) | np.asarray(codepoint, dtype=np.uint64)
+
+
+def bigram_id(player, first, second):
+    return ((np.uint64(player) << np.uint64(2 * _CP_BITS))
+            | (np.asarray(first, dtype=np.uint64) << np.uint64(_CP_BITS))
+            | np.asarray(second, dtype=np.uint64))
+
+
+class SparseStats:
+    """Counts, errors and a latency histogram per uint64 id, kept sorted by id"""
+
+    def __init__(self):
+        self.ids = np.empty(0, dtype=np.uint64)
+        self.count = np.empty(0, dtype=np.int64)
+        self.errors = np.empty(0, dtype=np.int64)
+        self.lat_n = np.empty(0, dtype=np.int64)
+        self.lat_sum = np.empty(0, dtype=np.float64)
+        self.hist = np.empty((0, N_BINS), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rows(self, ids):
+        uniq, inverse = np.unique(ids, return_inverse=True)
+        new = np.setdiff1d(uniq, self.ids, assume_unique=True)
+        if len(new):
+            merged = np.union1d(self.ids, new)
+            old_rows = np.searchsorted(merged, self.ids)
+            for name in ("count", "errors", "lat_n", "lat_sum", "hist"):
+                old = getattr(self, name)
+                grown = np.zeros((len(merged),) + old.shape[1:], dtype=old.dtype)
+                grown[old_rows] = old
+                setattr(self, name, grown)
+            self.ids = merged
+        return np.searchsorted(self.ids, uniq)[inverse]
+
+    def add(self, ids, errors, latency):
+        """Fold in one observation per id; latency is NaN where not measured"""
+        if not len(ids):
+            return
+        rows = self._rows(ids)
+        n = len(self.ids)
+        self.count += np.bincount(rows, minlength=n)
+        self.errors += np.bincount(rows, weights=errors, minlength=n).astype(np.int64)
+        timed = ~np.isnan(latency)
+        timed_rows = rows[timed]
+        self.lat_n += np.bincount(timed_rows, minlength=n)
+        self.lat_sum += np.bincount(timed_rows, weights=latency[timed], minlength=n)
+        bins = np.searchsorted(LATENCY_EDGES, latency[timed], side="right") - 1
+        np.add.at(self.hist, (timed_rows, bins), 1)
+
+    def select(self, lo, hi):
+        """Row indices with lo <= id < hi"""
+        return np.arange(np.searchsorted(self.ids, np.uint64(lo)),
+                         np.searchsorted(self.ids, np.uint64(hi)))
+
+    def quantile(self, rows, q):
+        """Latency quantile per row, interpolated inside histogram bins"""
+        hist = self.hist[rows]
+        totals = hist.sum(axis=1)
+        cum = np.cumsum(hist, axis=1)
+        target = q * totals
+        b = np.minimum((cum < target[:, None]).sum(axis=1), N_BINS - 1)
+        below = np.where(b > 0, cum[np.arange(len(rows)), b - 1], 0)
+        in_bin = np.maximum(hist[np.arange(len(rows)), b], 1)
+        lo = LATENCY_EDGES[b]
+        hi = np.where(np.isinf(LATENCY_EDGES[b + 1]), lo, LATENCY_EDGES[b + 1])
+        result = lo + (hi - lo) * np.clip((target - below) / in_bin, 0, 1)
+        return np.where(totals > 0, result, np.nan)
+
+    def state(self, prefix):
+        return {f"{prefix}_{name}": getattr(self, name)
+                for name in ("ids", "count", "errors", "lat_n", "lat_sum", "hist")}
+
+    def load(self, data, prefix):
+        for name in ("ids", "count", "errors", "lat_n", "lat_sum", "hist"):
+            setattr(self, name, data[f"{prefix}_{name}"])
+
+
+class TypingAnalytics:
+    """Incremental aggregates over a sessions directory"""
+
+    def __init__(self, sessions_dir, state_path=None):
+        self.sessions_dir = sessions_dir
+        self.state_path = state_path or os.path.join(sessions_dir, STATE_FILE)
+        self.keys = SparseStats()
+        self.bigrams = SparseStats()
+        self.players = {}
+        self.offsets = {}
+        self.session_ids = np.empty(0, dtype=np.uint64)
+        self.session_players = np.empty(0, dtype=np.int64)
+        # {player: {difficulty: [(start, wpm), ...]}}
+        self.curves = {}
+        # Keystrokes dropped because their session's metadata never arrived
+        self.orphans = 0
+        # Metadata lines that were not valid session records
+        self.bad_lines = 0
+        if os.path.exists(self.state_path):
+            self.load()
+
+    def player_id(self, name):
+        if name not in self.players:
+            self.players[name] = len(self.players) + 1
+        return self.players[name]
+
+    def ingest(self):
+        """Fold in everything appended since the last ingest; returns (sessions, keystrokes)"""
+        sessions = self._ingest_metadata()
+        keystrokes = 0
+        for path in sorted(glob.glob(os.path.join(self.sessions_dir, "keystrokes-*.bin"))):
+            keystrokes += self._ingest_keystrokes(path)
+        return sessions, keystrokes
+
+    def _ingest_metadata(self):
+        ids, players = [], []
+        for path in sorted(glob.glob(os.path.join(self.sessions_dir, "sessions-*.jsonl"))):
+            name = os.path.basename(path)
+            with open(path, "rb") as f:
+                f.seek(self.offsets.get(name, 0))
+                data = f.read()
+            # Only whole lines; a line still being written is picked up next time
+            data = data[:data.rfind(b"\n") + 1]
+            for line in data.split(b"\n")[:-1]:
+                try:
+                    meta = json.loads(line)
+                    session = int(meta["session"])
+                    if not 0 <= session < 1 << 64:
+                        raise ValueError(session)
+                    player, difficulty = str(meta.get("player", "")), str(meta.get("difficulty", ""))
+                    point = (float(meta.get("start", 0.0)), float(meta.get("wpm", 0.0)))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # Skipped for good; its keystrokes end up as orphans
+                    self.bad_lines += 1
+                else:
+                    ids.append(session)
+                    players.append(self.player_id(player))
+                    self.curves.setdefault(player, {}).setdefault(difficulty, []).append(point)
+                # Past this line only once it has been taken in or skipped
+                self.offsets[name] = self.offsets.get(name, 0) + len(line) + 1
+        if ids:
+            ids = np.array(ids, dtype=np.uint64)
+            order = np.argsort(np.concatenate((self.session_ids, ids)))
+            self.session_ids = np.concatenate((self.session_ids, ids))[order]
+            self.session_players = np.concatenate((self.session_players, players))[order]
+        return len(ids)
+
+    def _ingest_keystrokes(self, path):
+        name = os.path.basename(path)
+        offset = self.offsets.get(name, 0)
+        size = os.path.getsize(path)
+        n = (size - offset) // RECORD_DTYPE.itemsize
+        if n <= 0:
+            return 0
+        records = np.fromfile(path, dtype=RECORD_DTYPE, count=n, offset=offset)
+        pos = np.minimum(np.searchsorted(self.session_ids, records["session"]), max(len(self.session_ids) - 1, 0))
+        known = (self.session_ids[pos] == records["session"]) if len(self.session_ids) else np.zeros(n, bool)
+        if not known.all():
+            # Unknown sessions at the tail may still get their metadata line;
+            # ones followed by known sessions lost it (the writer died or the
+            # append failed), so skip them rather than stall the file
+            n = n - int(np.argmax(known[::-1])) if known.any() else 0
+            keep = known[:n]
+            self.orphans += int(n - keep.sum())
+            records, pos = records[:n][keep], pos[:n][keep]
+        self.offsets[name] = offset + n * RECORD_DTYPE.itemsize
+        if len(records):
+            self._aggregate(records, self.session_players[pos])
+        return len(records)
+
+    def _aggregate(self, rec, player):
+        session = rec["session"]
+        expected = rec["expected"]
+        correct = rec["correct"]
+        typed = (correct >= 0) & (expected != 0)
+        same = np.r_[False, session[1:] == session[:-1]]
+        gap = np.r_[np.nan, np.diff(rec["t"])]
+        latency = np.where(same & (gap <= PAUSE) & (correct == 1), gap, np.nan)
+        errors = (correct == 0).astype(np.float64)
+
+        k = typed
+        for p in (player[k], ALL_PLAYERS):
+            self.keys.add(key_id(p, expected[k]), errors[k], latency[k])
+
+        prev_ok = np.r_[False, typed[:-1] & (correct[:-1] == 1)]
+        b = typed & same & prev_ok
+        prev_expected = np.r_[0, expected[:-1]].astype(np.uint32)
+        for p in (player[b], ALL_PLAYERS):
+            self.bigrams.add(bigram_id(p, prev_expected[b], expected[b]), errors[b], latency[b])
+
+    def save(self):
+        meta = {"players": self.players, "offsets": self.offsets, "curves": self.curves,
+                "orphans": self.orphans, "bad_lines": self.bad_lines}
+        # Unique per writer: stations sharing the directory save concurrently
+        tmp = f"{self.state_path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp.npz"
+        np.savez(tmp, meta=np.array(json.dumps(meta)),
+                 session_ids=self.session_ids, session_players=self.session_players,
+                 **self.keys.state("keys"), **self.bigrams.state("bigrams"))
+        os.replace(tmp, self.state_path)
+
+    def load(self):
+        with np.load(self.state_path) as data:
+            meta = json.loads(str(data["meta"]))
+            self.session_ids = data["session_ids"]
+            self.session_players = data["session_players"]
+            self.keys.load(data, "keys")
+            self.bigrams.load(data, "bigrams")
+        self.players = meta["players"]
+        self.offsets = meta["offsets"]
+        self.orphans = meta.get("orphans", 0)
+        self.bad_lines = meta.get("bad_lines", 0)
+        self.curves = {}
+        for key, value in meta["curves"].items():
+            if isinstance(value, list):
+                # Older state files keyed curves by "player|difficulty"
+                key, _, difficulty = key.rpartition("|")
+                value = {difficulty: value}
+            player = self.curves.setdefault(key, {})
+            for difficulty, points in value.items():
+                player.setdefault(difficulty, []).extend(tuple(p) for p in points)
+
+    def _player_range(self, player, shift):
+        pid = ALL_PLAYERS if player is None else self.players.get(player)
+        if pid is None:
+            return None
+        return pid << shift, (pid + 1) << shift
+
+    def key_report(self, player=None, min_count=20):
+        """Rows of (char, attempts, error rate, mean latency s), worst error rate first"""
+        span = self._player_range(player, 32)
+        if span is None:
+            return []
+        stats = self.keys
+        rows = stats.select(*span)
+        rows = rows[stats.count[rows] >= min_count]
+        rate = stats.errors[rows] / stats.count[rows]
+        mean = stats.lat_sum[rows] / np.maximum(stats.lat_n[rows], 1)
+        order = np.lexsort((-mean, -rate))
+        return [(chr(int(stats.ids[r]) & _CP_MASK), int(stats.count[r]), float(rate[i]), float(mean[i]))
+                for i, r in ((i, rows[i]) for i in order)]
+
+    def bigram_report(self, player=None, min_count=10):
+        """Rows of (bigram, attempts, error rate, median s, p90 s), slowest first"""
+        span = self._player_range(player, 2 * _CP_BITS)
+        if span is None:
+            return []
+        stats = self.bigrams
+        rows = stats.select(*span)
+        rows = rows[stats.lat_n[rows] >= min_count]
+        median = stats.quantile(rows, 0.5)
+        p90 = stats.quantile(rows, 0.9)
+        rate = stats.errors[rows] / stats.count[rows]
+        order = np.argsort(-median)
+        result = []
+        for i in order:
+            bid = int(stats.ids[rows[i]])
+            pair = chr((bid >> _CP_BITS) & _CP_MASK) + chr(bid & _CP_MASK)
+            result.append((pair, int(stats.count[rows[i]]), float(rate[i]), float(median[i]), float(p90[i])))
+        return result
+
+    def weakness(self, player=None, top=24, min_count=20):
+        """{n-gram id: weight} for the player's weakest keys and bigrams.
+
+        Ids are key_id/bigram_id with the player bits cleared. The weight is
+        how far the error rate and mean latency sit above the player's own
+        average (1.0 + 1.0 is average), so only below-average n-grams appear.
+        """
+        weights = {}
+        for stats, shift, min_n in ((self.keys, 32, min_count), (self.bigrams, 2 * _CP_BITS, min_count // 2)):
+            span = self._player_range(player, shift)
+            if span is None:
+                continue
+            rows = stats.select(*span)
+            rows = rows[(stats.count[rows] >= min_n) & (stats.lat_n[rows] > 0)]
+            if not len(rows):
+                continue
+            count, errors = stats.count[rows], stats.errors[rows]
+            lat_n, lat_sum = stats.lat_n[rows], stats.lat_sum[rows]
+            base_rate = max(errors.sum() / count.sum(), 0.01)
+            base_latency = lat_sum.sum() / lat_n.sum()
+            score = (errors / count) / base_rate + (lat_sum / lat_n) / base_latency - 2
+            best = np.argsort(-score)[:top]
+            best = best[score[best] > 0]
+            ids = stats.ids[rows[best]] & np.uint64((1 << shift) - 1)
+            weights.update(zip(ids.tolist(), score[best].tolist()))
+        return weights
+
+    def wpm_curves(self, player=None):
+        """{(player, difficulty): (start times, wpm)} sorted by time"""
+        curves = {}
+        for name, by_difficulty in self.curves.items():
+            if player is not None and name != player:
+                continue
+            for difficulty, points in by_difficulty.items():
+                arr = np.array(sorted(points), dtype=np.float64).reshape(-1, 2)
+                curves[(name, difficulty)] = (arr[:, 0], arr[:, 1])
+        return curves
+
+
+def print_report(analytics, player=None, top=10):
+    who = player or "all players"
+    print(f"Slowest/most error-prone keys ({who}):")
+    for char, n, rate, mean in analytics.key_report(player)[:top]:
+        print(f"  {char!r:6} {n:7d} keys  {rate * 100:5.1f}% errors  {mean * 1000:6.0f} ms mean")
+    print(f"Slowest bigrams ({who}):")
+    for pair, n, rate, median, p90 in analytics.bigram_report(player)[:top]:
+        print(f"  {pair!r:6} {n:7d} pairs {rate * 100:5.1f}% errors  "
+              f"{median * 1000:6.0f} ms median  {p90 * 1000:6.0f} ms p90")
+    print("WPM by player and difficulty:")
+    for (name, difficulty), (_, wpm) in sorted(analytics.wpm_curves(player).items()):
+        window = min(10, len(wpm))
+        print(f"  {name} / {difficulty}: {len(wpm)} sessions, first {window} avg {wpm[:window].mean():.1f}, "
+              f"last {window} avg {wpm[-window:].mean():.1f}, best {wpm.max():.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Typing analytics across recorded sessions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("ingest", help="fold new sessions into the saved aggregates")
+    p.add_argument("sessions_dir")
+    p = sub.add_parser("report", help="ingest, then print per-key, bigram and WPM reports")
+    p.add_argument("sessions_dir")
+    p.add_argument("--player")
+    p.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    analytics = TypingAnalytics(args.sessions_dir)
+    sessions, keystrokes = analytics.ingest()
+    analytics.save()
+    print(f"Ingested {sessions} sessions, {keystrokes} keystrokes")
+    if analytics.orphans:
+        print(f"Skipped {analytics.orphans} keystrokes from sessions without metadata")
+    if analytics.bad_lines:
+        print(f"Skipped {analytics.bad_lines} malformed session metadata lines")
+    if args.command == "report":
+        print_report(analytics, args.player, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+"""Headless replay harness and frame-time benchmark for Typing Master Pro.
+
+Scripted keystroke streams are replayed through TypingTest.handle_event on a
+virtual clock (one frame every 1/60 s), with SDL's dummy video and audio
+drivers so no display or sound card is needed.
+
+    python benchmark.py                      # every scenario
+    python benchmark.py levels-hard --allocs
+    python benchmark.py --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+import type_testing
+from profiler import COUNTERS
+from type_testing import TypingTest, LEVELS
+
+FRAME_DT = 1 / 60
+WORDS = ("typing master python level speed accuracy keyboard practice "
+         "champion quick brown fox jumps over lazy dog code fast").split()
+
+
+class VirtualClock:
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+def key_event(char):
+    key = ord(char.lower()) if char.isascii() and char.isprintable() else 0
+    return pygame.event.Event(pygame.KEYDOWN, key=key, unicode=char, mod=0)
+
+
+def special_key(key):
+    return pygame.event.Event(pygame.KEYDOWN, key=key, unicode="", mod=0)
+
+
+def click():
+    return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(600, 400), button=1)
+
+
+class Script:
+    """Timestamped events and actions, built up in order"""
+
+    def __init__(self, key_interval=0.08):
+        self.items = []
+        self.t = 0.0
+        self.key_interval = key_interval
+
+    def at(self, item, delay):
+        self.t += delay
+        self.items.append((self.t, item))
+
+    def key(self, key, delay=0.2):
+        self.at(special_key(key), delay)
+
+    def click(self, delay=0.2):
+        self.at(click(), delay)
+
+    def type(self, text):
+        for char in text:
+            self.at(key_event(char), self.key_interval)
+
+    def action(self, fn, delay=0.0):
+        self.at(fn, delay)
+
+    def wait(self, seconds):
+        self.t += seconds
+
+    def start_game(self, difficulty="Medium", name="bench"):
+        steps = {"Easy": pygame.K_UP, "Medium": None, "Hard": pygame.K_DOWN}[difficulty]
+        if steps is not None:
+            self.key(steps)
+        self.key(pygame.K_RETURN)
+        self.type(name)
+        self.key(pygame.K_RETURN)
+
+
+def scenario_levels_hard():
+    script = Script()
+    script.start_game("Hard")
+    for level in sorted(LEVELS):
+        script.click()
+        script.type(LEVELS[level]["sentence"])
+        script.key(pygame.K_RETURN)
+        script.wait(1.5)
+        script.click()
+    script.wait(2.0)
+    return script
+
+
+def random_passage(length):
+    words = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(random.choice(WORDS))
+    return " ".join(words)[:length]
+
+
+def scenario_passage(length, typed=5000):
+    passage = random_passage(length)
+
+    def load_passage(game):
+        game.sentence = passage
+        game.typing.reset(passage)
+
+    script = Script(key_interval=0.05)
+    script.start_game()
+    script.action(load_passage)
+    script.click()
+    script.type(passage[:typed])
+    script.key(pygame.K_RETURN)
+    script.wait(1.0)
+    return script
+
+
+def scenario_passage_5k():
+    return scenario_passage(5000)
+
+
+def scenario_passage_50k():
+    """Same keystrokes as passage-5k; frame time should not grow with the text"""
+    return scenario_passage(50000)
+
+
+def scenario_explosions():
+    script = Script()
+    script.start_game()
+    script.click()
+    for i in range(40):
+        script.action(lambda game, i=i: game.create_explosion(200 + (i % 8) * 100, 400), 0.25)
+    script.wait(2.0)
+    return script
+
+
+SCENARIOS = {
+    "levels-hard": scenario_levels_hard,
+    "passage-5k": scenario_passage_5k,
+    "passage-50k": scenario_passage_50k,
+    "explosions": scenario_explosions,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def replay(script, seed=0, track_allocs=False):
+    """Replay a script frame by frame, returning per-frame timings"""
+    random.seed(seed)
+    clock = VirtualClock()
+    game = TypingTest()
+    game.time_source = clock
+    start = clock.now
+    items = script.items
+    next_item = 0
+    frame_times = []
+    frame_allocs = []
+    events = 0
+    counters_start = dict(COUNTERS)
+    if track_allocs:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    end = start + script.t + FRAME_DT
+    while clock.now <= end and game.running:
+        if track_allocs:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        while next_item < len(items) and start + items[next_item][0] <= clock.now:
+            item = items[next_item][1]
+            if callable(item):
+                item(game)
+            else:
+                # Stamped with the scripted time, not the frame it lands in
+                game.handle_event(item, start + items[next_item][0])
+                events += 1
+            next_item += 1
+        game.render_frame()
+        frame_times.append(time.perf_counter() - t0)
+        if track_allocs:
+            frame_allocs.append(tracemalloc.get_traced_memory()[1] - base)
+        clock.now += FRAME_DT
+    wall = time.perf_counter() - wall_start
+    if track_allocs:
+        tracemalloc.stop()
+    counters = {name: COUNTERS[name] - counters_start[name] for name in COUNTERS}
+    return frame_times, frame_allocs, events, wall, counters
+
+
+def summarize(name, frame_times, frame_allocs, events, wall, counters=None):
+    ms = sorted(t * 1000 for t in frame_times)
+    result = {
+        "scenario": name,
+        "frames": len(ms),
+        "events": events,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": ms[-1] if ms else 0.0,
+        "mean_ms": sum(ms) / len(ms) if ms else 0.0,
+        "frames_per_s": len(ms) / wall if wall else 0.0,
+        "events_per_s": events / wall if wall else 0.0,
+    }
+    for counter, value in (counters or {}).items():
+        result[f"{counter}_per_frame"] = value / len(ms) if ms else 0.0
+    if frame_allocs:
+        kb = sorted(a / 1024 for a in frame_allocs)
+        result["alloc_kb_p50"] = percentile(kb, 50)
+        result["alloc_kb_p95"] = percentile(kb, 95)
+        result["alloc_kb_mean"] = sum(kb) / len(kb)
+    return result
+
+
+def run_scenario(name, seed=0, track_allocs=False):
+    random.seed(seed)
+    script = SCENARIOS[name]()
+    result = summarize(name, *replay(script, seed))
+    if track_allocs:
+        # Separate pass: tracemalloc slows every allocation down
+        allocs = replay(script, seed, track_allocs=True)[1]
+        result.update({k: v for k, v in summarize(name, [0], allocs, 0, 1).items()
+                       if k.startswith("alloc_")})
+    return result
+
+
+def print_result(result):
+    print(f"{result['scenario']}: {result['frames']} frames, {result['events']} events")
+    print(f"  frame ms  p50 {result['p50_ms']:.3f}  p95 {result['p95_ms']:.3f}  "
+          f"p99 {result['p99_ms']:.3f}  max {result['max_ms']:.3f}")
+    print(f"  throughput {result['frames_per_s']:.0f} frames/s, {result['events_per_s']:.0f} events/s")
+    print(f"  font.render/frame {result['font_render_per_frame']:.2f}  "
+          f"Surfaces/frame {result['surface_alloc_per_frame']:.2f}")
+    if "alloc_kb_mean" in result:
+        print(f"  allocated KB/frame  p50 {result['alloc_kb_p50']:.1f}  "
+              f"p95 {result['alloc_kb_p95']:.1f}  mean {result['alloc_kb_mean']:.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless frame-time benchmark")
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--allocs", action="store_true",
+                        help="also measure allocations per frame (extra tracemalloc pass)")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    results = []
+    # Keep benchmark runs off the real leaderboard, sessions and sound cache
+    with tempfile.TemporaryDirectory(prefix="typing-bench-", ignore_cleanup_errors=True) as scratch:
+        type_testing.SCORES_DIR = scratch
+        type_testing.HIGH_SCORES_FILE = os.path.join(scratch, "highscores.json")
+        type_testing.SESSIONS_DIR = os.path.join(scratch, "sessions")
+        type_testing.SOUND_CACHE_DIR = os.path.join(scratch, "cache")
+        type_testing.SNAPSHOT_DIR = scratch
+        try:
+            for name in args.scenarios or list(SCENARIOS):
+                result = run_scenario(name, args.seed, args.allocs)
+                print_result(result)
+                results.append(result)
+        finally:
+            pygame.quit()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+"""Passage corpus backed by a memory-mapped offset index.
+
+A corpus is a UTF-8 text file with one passage per paragraph (passages are
+separated by blank lines). Indexing it once writes <corpus>.idx.npy, a
+fixed-size record per passage (byte offset, byte length, character count,
+character-class flags, difficulty). Opening a corpus only memory-maps that
+index and the text, so startup cost does not grow with corpus size.
+
+    python corpus.py index passages.txt
+    python corpus.py sample passages.txt --min-len 100 --max-len 300
+"""
+import argparse
+import json
+import mmap
+import os
+import random
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("chars", "<u4"),
+    ("charset", "<u1"),
+    ("difficulty", "<f4"),
+])
+
+# Character-class flags stored per passage
+LOWER = 1
+UPPER = 2
+DIGIT = 4
+PUNCT = 8
+NON_ASCII = 16
+ASCII_TEXT = LOWER | UPPER | DIGIT | PUNCT
+
+_LOWER_BYTES = bytes(range(ord("a"), ord("z") + 1))
+_UPPER_BYTES = bytes(range(ord("A"), ord("Z") + 1))
+_DIGIT_BYTES = b"0123456789"
+_PUNCT_BYTES = bytes(c for c in range(33, 127) if not chr(c).isalnum())
+_NON_ASCII_BYTES = bytes(range(128, 256))
+
+
+class CorpusError(Exception):
+    pass
+
+
+def _class_count(data, members):
+    return len(data) - len(data.translate(None, members))
+
+
+def passage_stats(data):
+    """(chars, charset flags, difficulty) for one normalized passage"""
+    chars = len(data.decode("utf-8", "replace"))
+    counts = {
+        LOWER: _class_count(data, _LOWER_BYTES),
+        UPPER: _class_count(data, _UPPER_BYTES),
+        DIGIT: _class_count(data, _DIGIT_BYTES),
+        PUNCT: _class_count(data, _PUNCT_BYTES),
+        NON_ASCII: _class_count(data, _NON_ASCII_BYTES),
+    }
+    charset = 0
+    for flag, n in counts.items():
+        if n:
+            charset |= flag
+    words = data.count(b" ") + 1
+    avg_word = (chars - words + 1) / words
+    rare = counts[UPPER] + counts[DIGIT] + 1.5 * counts[PUNCT] + 2 * counts[NON_ASCII]
+    difficulty = rare / max(chars, 1) + max(0.0, avg_word - 4) / 10
+    return chars, charset, difficulty
+
+
+def _paragraphs(f):
+    """Yield (offset, length, lines) of each blank-line separated paragraph"""
+    offset = 0
+    start = None
+    end = 0
+    lines = []
+    for line in f:
+        if line.strip():
+            if start is None:
+                start = offset
+            end = offset + len(line)
+            lines.append(line)
+        elif start is not None:
+            yield start, end - start, lines
+            start = None
+            lines = []
+        offset += len(line)
+    if start is not None:
+        yield start, end - start, lines
+
+
+def index_path(path):
+    return path + ".idx.npy"
+
+
+def _meta_path(path):
+    return path + ".idx.json"
+
+
+def _corpus_signature(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime": st.st_mtime}
+
+
+def build_index(path, chunk=65536):
+    """Scan the corpus once and write its offset index next to it"""
+    tmp = index_path(path) + ".tmp"
+    records = []
+    count = 0
+    with open(path, "rb") as f, open(tmp, "wb") as out:
+        np.lib.format.write_array_header_1_0(out, {
+            "descr": np.lib.format.dtype_to_descr(INDEX_DTYPE),
+            "fortran_order": False,
+            "shape": (0,),
+        })
+        header_end = out.tell()
+        for offset, length, lines in _paragraphs(f):
+            data = b" ".join(b"".join(lines).split())
+            records.append((offset, length) + passage_stats(data))
+            if len(records) >= chunk:
+                out.write(np.array(records, dtype=INDEX_DTYPE).tobytes())
+                count += len(records)
+                records = []
+        if records:
+            out.write(np.array(records, dtype=INDEX_DTYPE).tobytes())
+            count += len(records)
+        # Rewrite the header now that the record count is known
+        out.seek(0)
+        np.lib.format.write_array_header_1_0(out, {
+            "descr": np.lib.format.dtype_to_descr(INDEX_DTYPE),
+            "fortran_order": False,
+            "shape": (count,),
+        })
+        if out.tell() != header_end:
+            raise CorpusError("Index header size changed while writing")
+    os.replace(tmp, index_path(path))
+    with open(_meta_path(path), "w") as f:
+        json.dump(_corpus_signature(path), f)
+    return count
+
+
+def index_is_current(path):
+    try:
+        with open(_meta_path(path)) as f:
+            return json.load(f) == _corpus_signature(path) and os.path.exists(index_path(path))
+    except (OSError, ValueError):
+        return False
+
+
+def _matches(records, min_len=0, max_len=None, charset=ASCII_TEXT,
+             min_difficulty=None, max_difficulty=None):
+    mask = records["chars"] >= min_len
+    if max_len is not None:
+        mask &= records["chars"] <= max_len
+    if charset is not None:
+        mask &= (records["charset"] & ~np.uint8(charset)) == 0
+    if min_difficulty is not None:
+        mask &= records["difficulty"] >= min_difficulty
+    if max_difficulty is not None:
+        mask &= records["difficulty"] <= max_difficulty
+    return mask
+
+
+class Corpus:
+    """Read-only view of an indexed corpus; passages are read on demand"""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.index = np.load(index_path(path), mmap_mode="r")
+            self._file = open(path, "rb")
+            size = os.fstat(self._file.fileno()).st_size
+            self._text = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        except (OSError, ValueError) as e:
+            raise CorpusError(f"Could not open corpus {path}: {e}") from e
+
+    def __len__(self):
+        return len(self.index)
+
+    def passage(self, i):
+        record = self.index[i]
+        start = int(record["offset"])
+        data = self._text[start:start + int(record["length"])]
+        return " ".join(data.decode("utf-8", "replace").split())
+
+    def candidates(self, **criteria):
+        """Indices of passages matching the length/charset/difficulty filters"""
+        return np.flatnonzero(_matches(self.index, **criteria))
+
+    def matches(self, ids, **criteria):
+        """Mask of which passages in ids match the filters; reads only their index records"""
+        return _matches(self.index[ids], **criteria)
+
+    def select(self, rng=random, exclude=(), **criteria):
+        """A random passage matching criteria, or None if nothing matches"""
+        ids = self.candidates(**criteria)
+        if exclude:
+            ids = np.setdiff1d(ids, np.fromiter(exclude, dtype=np.int64), assume_unique=True)
+        if not len(ids):
+            return None
+        i = int(ids[rng.randrange(len(ids))])
+        return i, self.passage(i)
+
+    def close(self):
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        self._file.close()
+
+
+def open_corpus(path, on_ready=None):
+    """Open path if its index is current, otherwise index it on a worker thread.
+
+    Returns the Corpus, or None while indexing; on_ready(corpus) is called
+    from the worker once the index has been built.
+    """
+    if index_is_current(path):
+        return Corpus(path)
+
+    def worker():
+        try:
+            build_index(path)
+            corpus = Corpus(path)
+        except (OSError, CorpusError) as e:
+            print(f"Corpus disabled: {e}")
+            return
+        if on_ready is not None:
+            on_ready(corpus)
+
+    threading.Thread(target=worker, name="corpus-index", daemon=True).start()
+    return None
+
+
+class PassagePrefetcher:
+    """Selects upcoming passages on a worker thread"""
+
+    def __init__(self, corpus, rng=None):
+        self.corpus = corpus
+        self.rng = rng or random.Random()
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.pending = {}
+        self.used = set()
+
+    def prefetch(self, key, **criteria):
+        if key not in self.pending:
+            self.pending[key] = self.pool.submit(self._select, criteria)
+
+    def _select(self, criteria):
+        return self.corpus.select(self.rng, self.used, **criteria)
+
+    def run(self, fn, *args):
+        """Queue fn on the worker, ahead of any later prefetch"""
+        return self.pool.submit(fn, *args)
+
+    def get(self, key, timeout=None, **criteria):
+        """Prefetched passage for key (selecting it now if never requested).
+
+        Returns None if the worker hasn't produced it within timeout seconds;
+        it may be busy with a job queued earlier.
+        """
+        future = self.pending.pop(key, None)
+        if future is None:
+            future = self.pool.submit(self._select, criteria)
+        try:
+            result = future.result(timeout)
+        except FutureTimeout:
+            return None
+        if result is None:
+            return None
+        i, text = result
+        self.used.add(i)
+        return text
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Typing passage corpus tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("index", help="build the offset index for a corpus file")
+    p.add_argument("path")
+    p = sub.add_parser("sample", help="print random passages matching filters")
+    p.add_argument("path")
+    p.add_argument("--min-len", type=int, default=0)
+    p.add_argument("--max-len", type=int)
+    p.add_argument("--max-difficulty", type=float)
+    p.add_argument("-n", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "index":
+        print(f"Indexed {build_index(args.path)} passages")
+        return 0
+    if not index_is_current(args.path):
+        build_index(args.path)
+    corpus = Corpus(args.path)
+    for _ in range(args.n):
+        result = corpus.select(min_len=args.min_len, max_len=args.max_len,
+                               max_difficulty=args.max_difficulty)
+        if result is None:
+            print("No matching passages")
+            break
+        print(f"[{result[0]}] {result[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
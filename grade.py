@@ -0,0 +1,119 @@
+"""Grade recorded typing transcripts offline with the game's scoring rules.
+
+Input is JSON lines, one attempt per line:
+
+    {"player": "Asha", "difficulty": "Medium", "level": 3,
+     "target": "Python is great for coding", "typed": "Python is grat\\bet ...",
+     "timings": [0.21, 0.34, ...], "mode": "strict", "end": 9.8}
+
+"typed" is the keystroke sequence with "\\b" for backspace and "timings"
+the matching seconds since the attempt started; "mode" (strict/aligned)
+and "end" (when ENTER was pressed, default the last keystroke) are
+optional. Each output line carries the input's player/difficulty/level
+plus the scoring.grade() result, in input order. Lines are graded across a
+process pool in batches, with only a bounded number in flight, so the
+input can be far larger than memory.
+
+    python grade.py transcripts.jsonl -o results.jsonl
+    python grade.py - -j 8 < transcripts.jsonl > results.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+
+from scoring import DIFFICULTY_MODES, LEVELS, grade, replay
+
+# Lines per worker task
+BATCH_SIZE = 512
+# Tasks in flight per worker; bounds memory while keeping workers busy
+QUEUE_DEPTH = 4
+ROUND = 2
+
+
+def grade_line(line):
+    """Output record for one transcript line"""
+    try:
+        t = json.loads(line)
+        level, difficulty = int(t["level"]), t["difficulty"]
+        if level not in LEVELS or difficulty not in DIFFICULTY_MODES:
+            raise ValueError(f"unknown level/difficulty {level}/{difficulty}")
+        typing, keylog = replay(t["target"], t["typed"], t["timings"], t.get("mode", "strict"), t.get("end"))
+        result = {k: round(v, ROUND) if isinstance(v, float) else v
+                  for k, v in grade(typing, keylog, level, difficulty).items()}
+        out = {"player": t.get("player"), "difficulty": difficulty, "level": level, **result}
+    except (ValueError, KeyError, TypeError) as e:
+        out = {"error": str(e), "line": line[:200]}
+    return out
+
+
+def grade_batch(lines):
+    """(output lines as one string, error count) for a batch of lines"""
+    results = [grade_line(line) for line in lines]
+    errors = sum(1 for r in results if "error" in r)
+    return "".join(json.dumps(r) + "\n" for r in results), errors
+
+
+def batches(lines, size):
+    lines = (line for line in lines if line.strip())
+    while True:
+        batch = list(islice(lines, size))
+        if not batch:
+            return
+        yield batch
+
+
+def grade_stream(lines, out, jobs=None, batch_size=BATCH_SIZE):
+    """Grade lines into out in order; returns (transcripts, errors)"""
+    jobs = jobs or os.cpu_count() or 1
+    total = errors = 0
+    pending = deque()
+
+    def drain():
+        nonlocal total, errors
+        n, result = pending.popleft()
+        text, failed = result.get()
+        out.write(text)
+        total += n
+        errors += failed
+
+    with Pool(jobs) as pool:
+        for batch in batches(lines, batch_size):
+            if len(pending) >= jobs * QUEUE_DEPTH:
+                drain()
+            pending.append((len(batch), pool.apply_async(grade_batch, (batch,))))
+        while pending:
+            drain()
+    return total, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade typing transcripts (JSON lines) with the game's scoring")
+    parser.add_argument("input", help="transcripts file, or - for stdin")
+    parser.add_argument("-o", "--output", help="results file (default stdout)")
+    parser.add_argument("-j", "--jobs", type=int, help="worker processes (default: all CPUs)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        total, errors = grade_stream(source, out, args.jobs, args.batch_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"Graded {total} transcripts ({errors} errors) in {elapsed:.1f} s, "
+          f"{total / elapsed if elapsed else 0:.0f} transcripts/s", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import json
+import os
+import socket
+import uuid
+from array import array
+from struct import Struct
+
+BACKSPACE = "\b"
+NO_CHAR = 0
+
+# On-disk keystroke record: session id, typed and expected codepoints,
+# seconds since the attempt started, correct flag (-1 for backspace).
+# analytics.RECORD_DTYPE mirrors this layout.
+RECORD = Struct("<QIIdb")
+
+
+class KeystrokeLog:
+    """Array-backed log of keystrokes stamped with a monotonic clock.
+
+    Each entry is (typed codepoint, expected codepoint, timestamp in seconds,
+    correct flag); backspaces are logged as BACKSPACE with correct = -1.
+    WPM, keystroke accuracy and inter-key latency are derived from it.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.start_time = None
+        self.end_time = None
+        self.keys = array('I')
+        self.expected = array('I')
+        self.times = array('d')
+        self.correct = array('b')
+
+    def start(self, t):
+        self.clear()
+        self.start_time = t
+
+    def finish(self, t):
+        self.end_time = t
+
+    def __len__(self):
+        return len(self.times)
+
+    def record(self, char, t, expected=""):
+        self.keys.append(ord(char))
+        self.expected.append(ord(expected) if expected else NO_CHAR)
+        self.times.append(t)
+        self.correct.append(1 if char == expected else 0)
+
+    def record_backspace(self, t):
+        self.keys.append(ord(BACKSPACE))
+        self.expected.append(NO_CHAR)
+        self.times.append(t)
+        self.correct.append(-1)
+
+    def net_chars(self):
+        """Characters left in the input after backspaces"""
+        n = 0
+        backspace = ord(BACKSPACE)
+        for key in self.keys:
+            n = max(0, n - 1) if key == backspace else n + 1
+        return n
+
+    def elapsed(self, end=None):
+        if self.start_time is None:
+            return 0.0
+        if end is None:
+            end = self.end_time if self.end_time is not None else (self.times[-1] if self.times else self.start_time)
+        return max(0.0, end - self.start_time)
+
+    def wpm(self, end=None):
+        elapsed = self.elapsed(end)
+        return (self.net_chars() / 5) / (elapsed / 60) if elapsed > 0 else 0.0
+
+    def keystroke_accuracy(self):
+        """Share of character keystrokes that matched the expected character"""
+        typed = sum(1 for c in self.correct if c >= 0)
+        return (sum(1 for c in self.correct if c == 1) / typed) * 100 if typed else 0.0
+
+    def latencies(self):
+        """Seconds between consecutive keystrokes"""
+        times = self.times
+        return [times[i] - times[i - 1] for i in range(1, len(times))]
+
+    def latency_stats(self):
+        gaps = sorted(self.latencies())
+        if not gaps:
+            return {"mean": 0.0, "median": 0.0, "p95": 0.0}
+        return {
+            "mean": sum(gaps) / len(gaps),
+            "median": gaps[len(gaps) // 2],
+            "p95": gaps[min(len(gaps) - 1, int(len(gaps) * 0.95))],
+        }
+
+
+def _append(path, data):
+    """Append data with a single O_APPEND write so concurrent writers don't interleave"""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def save_session(directory, keylog, **meta):
+    """Append one attempt's keystrokes and metadata to the per-host session files.
+
+    Keystrokes are written before the metadata line, so a reader that only
+    trusts sessions with metadata never sees a half-written session.
+    """
+    session = uuid.uuid4().int >> 65
+    host = socket.gethostname()
+    os.makedirs(directory, exist_ok=True)
+    start = keylog.start_time or 0.0
+    data = b"".join(RECORD.pack(session, key, expected, t - start, correct)
+                    for key, expected, t, correct in
+                    zip(keylog.keys, keylog.expected, keylog.times, keylog.correct))
+    _append(os.path.join(directory, f"keystrokes-{host}.bin"), data)
+    meta.update(session=session, keys=len(keylog))
+    _append(os.path.join(directory, f"sessions-{host}.jsonl"), (json.dumps(meta) + "\n").encode())
+    return session
@@ -0,0 +1,69 @@
+from array import array
+from bisect import bisect_right
+
+
+class ParagraphLayout:
+    """Word-wrapped layout of a passage, computed once from glyph widths.
+
+    Keeps the x offset of every character and the index where each line
+    starts, so finding the caret's line is a binary search and drawing
+    touches only the characters of the lines on screen. Lines break after
+    spaces; a word wider than the line is split. Spaces may run past the
+    right edge so a line never starts with the space that ended the last.
+    """
+
+    def __init__(self, text, advance, width):
+        self.text = text
+        self.width = width
+        self.x = array('i')
+        self.starts = array('i', [0])
+        widths = {}
+        xs, starts = self.x, self.starts
+        x = 0
+        line_start = 0
+        brk = -1
+        for i, char in enumerate(text):
+            w = widths.get(char)
+            if w is None:
+                w = widths[char] = advance(char)
+            if char == "\n":
+                xs.append(x)
+                starts.append(i + 1)
+                line_start, x = i + 1, 0
+                continue
+            if x + w > width and char != " " and i > line_start:
+                new = brk + 1 if brk >= line_start else i
+                if new < i:
+                    shift = xs[new]
+                    for j in range(new, i):
+                        xs[j] -= shift
+                    x -= shift
+                else:
+                    x = 0
+                starts.append(new)
+                line_start = new
+            xs.append(x)
+            x += w
+            if char == " ":
+                brk = i
+
+    def __len__(self):
+        return len(self.starts)
+
+    def line_of(self, index):
+        """Line holding character index (the end of the text is on the last line)"""
+        return max(0, bisect_right(self.starts, index) - 1)
+
+    def line_range(self, line):
+        end = self.starts[line + 1] if line + 1 < len(self.starts) else len(self.text)
+        return self.starts[line], end
+
+    def scroll(self, caret, top, rows):
+        """First line to show so the caret's line, and the one after it, are in view"""
+        line = self.line_of(caret)
+        ahead = min(1, rows - 1)
+        if line < top:
+            top = line
+        elif line > top + rows - 1 - ahead:
+            top = line - rows + 1 + ahead
+        return max(0, min(top, len(self.starts) - rows))
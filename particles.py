@@ -0,0 +1,118 @@
+import random
+import pygame
+from profiler import count
+
+# NumPy is imported on the first explosion, keeping it off the startup path
+np = None
+
+PARTICLE_LIFE = 90
+GRAVITY = 0.2
+# Alpha is quantized into this many buckets so sprites can be reused
+ALPHA_BUCKETS = 16
+
+
+class ParticleSystem:
+    """Particles stored as preallocated NumPy arrays (structure of arrays).
+
+    Dead particles are swap-removed: survivors from the tail are moved into
+    the freed slots so the live particles always occupy [0, count).
+    """
+
+    def __init__(self, capacity=4096, color=(255, 215, 0)):
+        self.capacity = capacity
+        self.color = color
+        self.count = 0
+        self.sprites = {}
+        self.x = None
+
+    def _allocate(self):
+        global np
+        if np is None:
+            import numpy
+            np = numpy
+        capacity = self.capacity
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.int16)
+        self.size = np.zeros(capacity, dtype=np.float32)
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for name in ("x", "y", "vx", "vy", "life", "size"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def emit(self, x, y, n=100):
+        if self.x is None:
+            self._allocate()
+        if self.count + n > self.capacity:
+            self._grow(self.count + n)
+        rng = np.random.default_rng(random.getrandbits(32))
+        s = slice(self.count, self.count + n)
+        self.x[s] = x
+        self.y[s] = y
+        self.vx[s] = rng.uniform(-12, 12, n)
+        self.vy[s] = rng.uniform(-15, -3, n)
+        self.life[s] = PARTICLE_LIFE
+        self.size[s] = rng.integers(3, 9, n)
+        self.count += n
+
+    def update(self):
+        n = self.count
+        if not n:
+            return
+        self.x[:n] += self.vx[:n]
+        self.y[:n] += self.vy[:n]
+        self.vy[:n] += GRAVITY
+        self.life[:n] -= 1
+
+        alive = self.life[:n] > 0
+        keep = int(alive.sum())
+        if keep < n:
+            holes = np.flatnonzero(~alive[:keep])
+            movers = np.flatnonzero(alive[keep:]) + keep
+            for arr in (self.x, self.y, self.vx, self.vy, self.life, self.size):
+                arr[holes] = arr[movers]
+            self.count = keep
+
+    def sprite(self, radius, bucket):
+        key = (radius, bucket)
+        s = self.sprites.get(key)
+        if s is None:
+            alpha = 255 * bucket // (ALPHA_BUCKETS - 1)
+            s = pygame.Surface((radius*2, radius*2), pygame.SRCALPHA)
+            count("surface_alloc")
+            pygame.draw.circle(s, (*self.color, alpha), (radius, radius), radius)
+            self.sprites[key] = s
+        return s
+
+    def draw(self, surface):
+        """Blit live particles, returning the bounding rect that was touched"""
+        n = self.count
+        if not n:
+            return None
+        fade = self.life[:n] / PARTICLE_LIFE
+        radius = (self.size[:n] * fade).astype(np.int32)
+        bucket = (fade * (ALPHA_BUCKETS - 1)).astype(np.int32)
+        visible = np.flatnonzero(radius > 0)
+        px = (self.x[visible] - radius[visible]).astype(np.int32).tolist()
+        py = (self.y[visible] - radius[visible]).astype(np.int32).tolist()
+        if not len(visible):
+            return None
+        sprite = self.sprite
+        rects = surface.blits([(sprite(r, b), (x, y)) for r, b, x, y in
+                               zip(radius[visible].tolist(), bucket[visible].tolist(), px, py)])
+        return rects[0].unionall(rects[1:])
+
+    def clear(self):
+        self.count = 0
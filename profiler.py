@@ -0,0 +1,215 @@
+import csv
+import functools
+import json
+import os
+import time
+from collections import deque
+
+# Frames kept in memory; samples are written out in batches from this buffer
+RING_SIZE = 600
+FLUSH_EVERY = 120
+OVERLAY_REFRESH = 30
+
+# Process-wide hot-path counters, bumped wherever we call font.render or
+# create a pygame.Surface. Plain int adds, so they are always on.
+COUNTERS = {"font_render": 0, "surface_alloc": 0}
+
+
+def count(name, n=1):
+    COUNTERS[name] += n
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def profiled(method):
+    """Time a TypingTest method under its own name when profiling is on"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = self.profiler
+        if not profiler.enabled:
+            return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            profiler.add(name, time.perf_counter() - start)
+    return wrapper
+
+
+class FrameProfiler:
+    """Per-frame phase timings and counters kept in a ring buffer.
+
+    Enable with TYPING_PROFILE=1 (live overlay, F3 toggles it at runtime)
+    and/or TYPING_PROFILE_OUT=path.jsonl|path.csv to stream samples to disk.
+    """
+
+    def __init__(self, output=None, show_overlay=False, ring_size=RING_SIZE):
+        self.samples = deque(maxlen=ring_size)
+        self.output = output
+        self.show_overlay = show_overlay
+        self.enabled = show_overlay or output is not None
+        self.frame = 0
+        self.unwritten = 0
+        self.phases = {}
+        self.frame_start = 0.0
+        self.counter_start = {}
+        # Whether begin_frame ran for the current frame; a frame during which
+        # profiling was switched on has no start to measure from
+        self.in_frame = False
+        self.overlay_lines = []
+        self._file = None
+        self._csv = None
+
+    @classmethod
+    def from_env(cls):
+        output = os.environ.get("TYPING_PROFILE_OUT") or None
+        show = os.environ.get("TYPING_PROFILE", "") not in ("", "0")
+        return cls(output=output, show_overlay=show)
+
+    def toggle_overlay(self):
+        self.show_overlay = not self.show_overlay
+        self.enabled = self.show_overlay or self.output is not None
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.phases = {}
+        self.counter_start = dict(COUNTERS)
+        self.frame_start = time.perf_counter()
+        self.in_frame = True
+
+    def end_frame(self, status=None):
+        """Close the frame's sample; status (e.g. scheduler stats) is stored with it"""
+        if not self.enabled or not self.in_frame:
+            return
+        self.in_frame = False
+        total = time.perf_counter() - self.frame_start
+        self.frame += 1
+        sample = {
+            "frame": self.frame,
+            "time": time.time(),
+            "total_ms": total * 1000,
+            "phases": {name: s * 1000 for name, s in self.phases.items()},
+            "counters": {name: COUNTERS[name] - self.counter_start.get(name, 0) for name in COUNTERS},
+        }
+        if status:
+            sample["status"] = status
+        self.samples.append(sample)
+        self.unwritten = min(self.unwritten + 1, len(self.samples))
+        if self.output is not None and self.unwritten >= FLUSH_EVERY:
+            self.flush()
+        if self.show_overlay and self.frame % OVERLAY_REFRESH == 0:
+            self.overlay_lines = self.summary_lines()
+
+    def summary(self, frames=60):
+        """Average ms per phase and counters per frame over the last frames"""
+        recent = list(self.samples)[-frames:]
+        if not recent:
+            return {}
+        n = len(recent)
+        phases = {}
+        counters = {}
+        for sample in recent:
+            for name, ms in sample["phases"].items():
+                phases[name] = phases.get(name, 0.0) + ms / n
+            for name, value in sample["counters"].items():
+                counters[name] = counters.get(name, 0.0) + value / n
+        return {
+            "frames": n,
+            "total_ms": sum(s["total_ms"] for s in recent) / n,
+            "phases": phases,
+            "counters": counters,
+        }
+
+    def summary_lines(self):
+        summary = self.summary()
+        if not summary:
+            return []
+        lines = [f"frame {summary['total_ms']:.2f} ms"]
+        for name, ms in sorted(summary["phases"].items(), key=lambda item: -item[1]):
+            lines.append(f"{name} {ms:.2f} ms")
+        for name, value in summary["counters"].items():
+            lines.append(f"{name} {value:.1f}/frame")
+        status = self.samples[-1].get("status")
+        if status:
+            lines.append(" | ".join(f"{name} {value:.1f}" if isinstance(value, float) else f"{name} {value}"
+                                    for name, value in status.items()))
+        return lines
+
+    def draw(self, surface, text_cache, font, color=(0, 255, 0)):
+        """Draw the overlay, returning the rect it covered"""
+        if not self.show_overlay or not self.overlay_lines:
+            return None
+        rects = [surface.blit(text_cache.render(font, line, color), (10, 10 + i * 18))
+                 for i, line in enumerate(self.overlay_lines)]
+        return rects[0].unionall(rects[1:])
+
+    def flush(self):
+        if self.output is None or not self.unwritten:
+            return
+        pending = list(self.samples)[-self.unwritten:]
+        self.unwritten = 0
+        try:
+            if self._file is None:
+                self._file = open(self.output, "a", newline="")
+                if self.output.endswith(".csv"):
+                    self._csv = csv.writer(self._file)
+                    if self._file.tell() == 0:
+                        self._csv.writerow(["frame", "time", "name", "value"])
+            if self._csv is not None:
+                for sample in pending:
+                    rows = [("total_ms", sample["total_ms"])]
+                    rows += sample["phases"].items()
+                    rows += sample["counters"].items()
+                    rows += ((name, value) for name, value in sample.get("status", {}).items()
+                             if not isinstance(value, str))
+                    self._csv.writerows((sample["frame"], sample["time"], name, value)
+                                        for name, value in rows)
+            else:
+                self._file.writelines(json.dumps(sample) + "\n" for sample in pending)
+            self._file.flush()
+        except OSError as e:
+            print(f"Profiler output disabled: {e}")
+            self.output = None
+            self.enabled = self.show_overlay
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
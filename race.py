@@ -0,0 +1,435 @@
+"""Multiplayer typing races over the LAN, plus a load generator.
+
+The server hands every joined typist the same level sentence and scores
+their keystrokes with the game's rules (scoring.py). Protocol is JSON
+lines over TCP:
+
+    client -> {"type": "join", "name": "Asha"}
+    server -> {"type": "start", "level": 3, "difficulty": "Medium", "sentence": "...",
+               "countdown": 3, "time_limit": 50.0, "players": [[id, name], ...]}
+    client -> {"type": "key", "k": "P"}         ("\\b" for backspace)
+    client -> {"type": "done"}                  (ENTER)
+    server -> {"type": "board", "seq": 12, "sent": <time.time()>, "full": false,
+               "players": [[id, cursor, wpm, done], ...]}
+    server -> {"type": "results", "results": [...], "server": {...}}
+
+Progress is not echoed per keystroke. Every BOARD_INTERVAL the server
+encodes one board with only the players that changed and writes the same
+bytes to every client; a client whose send buffer is backed up skips
+boards and gets a full one once it drains, so one slow link never holds
+up the rest.
+
+    python race.py serve --players 4 --level 3 --difficulty Medium
+    python race.py load --clients 200 --spawn
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from keylog import KeystrokeLog, BACKSPACE
+from scoring import LEVELS, DIFFICULTY_MODES, grade, level_rules, type_key
+from typing_state import TypingState
+
+PORT = 8765
+# Seconds between progress boards
+BOARD_INTERVAL = 0.1
+# Seconds between the start message and the first accepted keystroke
+COUNTDOWN = 3
+# Bytes queued for a client above which it skips boards
+HIGH_WATER = 64 * 1024
+MAX_LINE = 4096
+MAX_PLAYERS = 1000
+
+
+class RaceError(Exception):
+    pass
+
+
+def _encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+class Racer:
+    def __init__(self, pid, name, writer):
+        self.id = pid
+        self.name = name
+        self.writer = writer
+        self.typing = None
+        self.keylog = KeystrokeLog()
+        self.result = None
+        self.changed = False
+        # Missed a board while backed up; needs the full board next
+        self.stale = False
+
+    @property
+    def done(self):
+        return self.result is not None
+
+    def row(self, now):
+        wpm = self.result["wpm"] if self.done else self.keylog.wpm(now)
+        return [self.id, self.typing.cursor, round(wpm, 1), int(self.done)]
+
+    def send(self, data):
+        if self.writer.is_closing():
+            return
+        self.writer.write(data)
+
+
+class RaceServer:
+    """Runs races back to back: lobby until enough typists join, race, results.
+
+    All state lives on the event loop thread; keystrokes are applied as they
+    arrive and only the board task writes progress to clients.
+    """
+
+    def __init__(self, level=1, difficulty="Medium", players=2, wait=None, mode="strict",
+                 interval=BOARD_INTERVAL, countdown=COUNTDOWN, races=None):
+        if level not in LEVELS:
+            raise RaceError(f"Unknown level: {level}")
+        if difficulty not in DIFFICULTY_MODES:
+            raise RaceError(f"Unknown difficulty: {difficulty}")
+        self.level = level
+        self.difficulty = difficulty
+        self.sentence = LEVELS[level]["sentence"]
+        self.min_players = players
+        self.wait = wait
+        self.mode = mode
+        self.interval = interval
+        self.countdown = countdown
+        self.races_left = races
+        self.lobby = {}
+        self.racers = {}
+        self.racing = False
+        self.next_id = 1
+        self.start_time = None
+        self.joined = None
+        self.finished = None
+        self.handlers = set()
+
+    async def serve(self, host="0.0.0.0", port=PORT):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        print(f"Race server on {host}:{port}, level {self.level} ({self.difficulty}), "
+              f"starting at {self.min_players} players", flush=True)
+        async with server:
+            while self.races_left is None or self.races_left > 0:
+                await self.run_race()
+                if self.races_left is not None:
+                    self.races_left -= 1
+            # Let the closed connections' handlers see EOF before the loop stops
+            if self.handlers:
+                await asyncio.wait(self.handlers, timeout=5)
+
+    async def handle(self, reader, writer):
+        racer = None
+        self.handlers.add(asyncio.current_task())
+        try:
+            hello = json.loads(await reader.readline() or "null")
+            if not isinstance(hello, dict) or hello.get("type") != "join":
+                raise ValueError("expected join")
+            if self.racing or len(self.lobby) >= MAX_PLAYERS:
+                writer.write(_encode({"type": "error", "error": "race in progress" if self.racing else "lobby full"}))
+                await writer.drain()
+                return
+            racer = Racer(self.next_id, str(hello.get("name") or f"Typist {self.next_id}")[:20], writer)
+            self.next_id += 1
+            self.lobby[racer.id] = racer
+            self.joined.set()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.on_message(racer, json.loads(line))
+        except (ValueError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            if racer is not None:
+                self.lobby.pop(racer.id, None)
+                self.joined.set()
+                # A typist who leaves mid-race is graded as they stand, so the
+                # race doesn't wait out the time limit for them
+                if self.racing and racer.id in self.racers and not racer.done:
+                    self.finish(racer, time.monotonic())
+            self.handlers.discard(asyncio.current_task())
+            writer.close()
+
+    def on_message(self, racer, message):
+        if not isinstance(message, dict) or not self.racing or racer.id not in self.racers or racer.done:
+            return
+        now = time.monotonic()
+        if now < self.start_time:
+            return
+        kind = message.get("type")
+        if kind == "key":
+            key = message.get("k")
+            if isinstance(key, str) and len(key) == 1:
+                type_key(racer.typing, racer.keylog, key, now)
+                racer.changed = True
+        elif kind == "done":
+            self.finish(racer, now)
+
+    def finish(self, racer, now):
+        racer.keylog.finish(now)
+        racer.result = grade(racer.typing, racer.keylog, self.level, self.difficulty)
+        racer.changed = True
+        if all(r.done for r in self.racers.values()):
+            self.finished.set()
+
+    async def gather_players(self):
+        self.joined = asyncio.Event()
+        deadline = None
+        while True:
+            if len(self.lobby) >= self.min_players:
+                return
+            if self.lobby and self.wait is not None:
+                deadline = deadline or time.monotonic() + self.wait
+                if time.monotonic() >= deadline:
+                    return
+            elif not self.lobby:
+                deadline = None
+            self.joined.clear()
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                await asyncio.wait_for(self.joined.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_race(self):
+        await self.gather_players()
+        self.racers, self.lobby = self.lobby, {}
+        self.racing = True
+        self.finished = asyncio.Event()
+        req_acc, time_limit = level_rules(self.level, self.difficulty, self.sentence)
+        for racer in self.racers.values():
+            racer.typing = TypingState(self.sentence, self.mode)
+        self.start_time = time.monotonic() + self.countdown
+        for racer in self.racers.values():
+            racer.keylog.start(self.start_time)
+        start = _encode({"type": "start", "level": self.level, "difficulty": self.difficulty,
+                         "sentence": self.sentence, "mode": self.mode, "countdown": self.countdown,
+                         "req_acc": req_acc, "time_limit": time_limit,
+                         "players": [[r.id, r.name] for r in self.racers.values()]})
+        for racer in self.racers.values():
+            racer.send(start)
+        print(f"Race started with {len(self.racers)} players", flush=True)
+
+        cpu, wall = time.process_time(), time.perf_counter()
+        stats = {"boards": 0, "bytes": 0, "skipped": 0}
+        board = asyncio.ensure_future(self.broadcast(stats))
+        try:
+            await asyncio.wait_for(self.finished.wait(), self.countdown + time_limit)
+        except asyncio.TimeoutError:
+            now = time.monotonic()
+            for racer in self.racers.values():
+                if not racer.done:
+                    self.finish(racer, now)
+        board.cancel()
+        self.racing = False
+        stats.update(cpu_s=time.process_time() - cpu, wall_s=time.perf_counter() - wall,
+                     players=len(self.racers))
+
+        ranked = sorted(self.racers.values(), key=lambda r: -r.result["score"])
+        results = _encode({"type": "results", "server": stats, "results": [
+            {"id": r.id, "name": r.name, **{k: round(v, 2) if isinstance(v, float) else v
+                                             for k, v in r.result.items()}}
+            for r in ranked]})
+        for racer in ranked:
+            racer.send(results)
+            racer.writer.close()
+        print(f"Race finished: {len(ranked)} players, {stats['boards']} boards, "
+              f"{stats['bytes'] / 1e6:.1f} MB sent, {stats['cpu_s']:.2f} s CPU", flush=True)
+
+    async def broadcast(self, stats):
+        """Send one batched board per interval to every client that can take it"""
+        seq = 0
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            racers = list(self.racers.values())
+            changed = [r for r in racers if r.changed]
+            if not changed and not any(r.stale for r in racers):
+                continue
+            for racer in changed:
+                racer.changed = False
+            seq += 1
+            sent = time.time()
+            delta = full = None
+            for racer in racers:
+                if racer.writer.is_closing():
+                    continue
+                if racer.writer.transport.get_write_buffer_size() > HIGH_WATER:
+                    racer.stale = True
+                    stats["skipped"] += 1
+                    continue
+                if racer.stale:
+                    if full is None:
+                        full = _encode({"type": "board", "seq": seq, "sent": sent, "full": True,
+                                        "players": [r.row(now) for r in racers]})
+                    data = full
+                    racer.stale = False
+                else:
+                    if not changed:
+                        continue
+                    if delta is None:
+                        delta = _encode({"type": "board", "seq": seq, "sent": sent, "full": False,
+                                         "players": [r.row(now) for r in changed]})
+                    data = delta
+                racer.send(data)
+                stats["boards"] += 1
+                stats["bytes"] += len(data)
+
+
+# Load generator
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def simulated_typist(host, port, name, rng, wpm, error_rate, latencies):
+    """Join, type the sentence at about wpm with occasional corrected typos, return results"""
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    writer.write(_encode({"type": "join", "name": name}))
+    results = None
+    boards = 0
+
+    async def receive():
+        nonlocal results, boards
+        async for line in reader:
+            message = json.loads(line)
+            if message["type"] == "board":
+                latencies.append(time.time() - message["sent"])
+                boards += 1
+            elif message["type"] in ("start", "results", "error"):
+                if message["type"] != "start":
+                    results = message
+                    return
+                started.set_result(message)
+
+    started = asyncio.get_running_loop().create_future()
+    listener = asyncio.ensure_future(receive())
+    done, _ = await asyncio.wait({started, listener}, return_when=asyncio.FIRST_COMPLETED)
+    if started in done:
+        start = started.result()
+        await asyncio.sleep(start["countdown"] + 0.05)
+        gap = 60 / (wpm * 5)
+        for char in start["sentence"]:
+            if rng.random() < error_rate:
+                writer.write(_encode({"type": "key", "k": rng.choice("asdfjkl")}))
+                await asyncio.sleep(rng.expovariate(1 / gap))
+                writer.write(_encode({"type": "key", "k": BACKSPACE}))
+                await asyncio.sleep(rng.expovariate(1 / gap))
+            writer.write(_encode({"type": "key", "k": char}))
+            await asyncio.sleep(rng.expovariate(1 / gap))
+        writer.write(_encode({"type": "done"}))
+        await listener
+    writer.close()
+    return results, boards
+
+
+async def run_load(host, port, clients, wpm, spread, error_rate, seed):
+    rng = random.Random(seed)
+    latencies = []
+    tasks = [simulated_typist(host, port, f"bot{i}", random.Random(rng.random()),
+                              max(10.0, rng.gauss(wpm, spread)), error_rate, latencies)
+             for i in range(clients)]
+    cpu, wall = time.process_time(), time.perf_counter()
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    return outcomes, latencies, time.process_time() - cpu, time.perf_counter() - wall
+
+
+async def _wait_for_port(host, port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RaceError(f"No race server on {host}:{port}")
+            await asyncio.sleep(0.1)
+
+
+def load_test(args):
+    server = None
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--host", args.host,
+                                   "--port", str(args.port), "--players", str(args.clients),
+                                   "--level", str(args.level), "--difficulty", args.difficulty,
+                                   "--races", "1"], stdout=subprocess.DEVNULL)
+    try:
+        asyncio.run(_wait_for_port(args.host, args.port))
+        outcomes, latencies, cpu, wall = asyncio.run(
+            run_load(args.host, args.port, args.clients, args.wpm, args.spread, args.error_rate, args.seed))
+    finally:
+        if server is not None:
+            server.wait(timeout=30)
+    finished, failures = [], []
+    for outcome in outcomes:
+        ok = not isinstance(outcome, BaseException) and outcome[0] and outcome[0]["type"] == "results"
+        (finished if ok else failures).append(outcome)
+    print(f"{len(finished)}/{args.clients} typists finished in {wall:.1f} s ({len(failures)} failed)")
+    if failures:
+        print(f"  first failure: {failures[0]!r}")
+    if latencies:
+        ms = [x * 1000 for x in latencies]
+        print(f"Board latency over {len(ms)} boards: p50 {_percentile(ms, 0.5):.1f} ms, "
+              f"p95 {_percentile(ms, 0.95):.1f} ms, p99 {_percentile(ms, 0.99):.1f} ms, max {max(ms):.1f} ms")
+    if finished:
+        boards = sum(o[1] for o in finished) / len(finished)
+        server_stats = finished[0][0]["server"]
+        print(f"Boards per client: {boards:.0f}; server sent {server_stats['bytes'] / 1e6:.1f} MB, "
+              f"skipped {server_stats['skipped']} backed-up sends")
+        print(f"Server CPU {server_stats['cpu_s']:.2f} s over {server_stats['wall_s']:.1f} s "
+              f"({100 * server_stats['cpu_s'] / max(server_stats['wall_s'], 1e-9):.0f}%)")
+    print(f"Load generator CPU {cpu:.2f} s")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multiplayer typing races")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="run a race server")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=PORT)
+    p.add_argument("--level", type=int, default=1)
+    p.add_argument("--difficulty", default="Medium")
+    p.add_argument("--mode", default="strict", choices=("strict", "aligned"))
+    p.add_argument("--players", type=int, default=2, help="start once this many have joined")
+    p.add_argument("--wait", type=float, help="or this many seconds after the first join")
+    p.add_argument("--races", type=int, help="stop after this many races")
+    p = sub.add_parser("load", help="race simulated typists against a server")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=PORT)
+    p.add_argument("--clients", type=int, default=200)
+    p.add_argument("--wpm", type=float, default=60)
+    p.add_argument("--spread", type=float, default=15)
+    p.add_argument("--error-rate", type=float, default=0.03)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--spawn", action="store_true", help="start a one-race server for the test")
+    p.add_argument("--level", type=int, default=1)
+    p.add_argument("--difficulty", default="Medium")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "serve":
+            server = RaceServer(args.level, args.difficulty, args.players, args.wait, args.mode, races=args.races)
+            asyncio.run(server.serve(args.host, args.port))
+            return 0
+        return load_test(args)
+    except (OSError, RaceError) as e:
+        print(e)
+        return 1
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+import pygame
+from profiler import count
+
+MAX_LAYERS = 8
+
+
+class LayeredRenderer:
+    """Cached static screen layers with dirty-rectangle display updates.
+
+    Each screen is a static layer (built once per key and cached) plus
+    named widgets that are redrawn only when their key changes. Sprites
+    (particles) are drawn on top every frame and erased from the layer on
+    the next one. present() pushes only the changed rectangles unless the
+    layer itself changed.
+    """
+
+    def __init__(self, screen, max_layers=MAX_LAYERS):
+        self.screen = screen
+        self.max_layers = max_layers
+        self.layers = OrderedDict()
+        self.layer = None
+        self.layer_key = None
+        self.widgets = {}
+        self.sprite_rects = []
+        self.restored = []
+        self.dirty = []
+        self.full_redraw = True
+        self.layer_builds = 0
+
+    def resize(self, screen):
+        self.screen = screen
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop every cached layer and repaint the whole window next frame"""
+        self.layers.clear()
+        self.layer_key = None
+        self.full_redraw = True
+
+    def begin(self, key, build):
+        """Start a frame on the static layer for key, building it if needed"""
+        layer = self.layers.get(key)
+        if layer is None:
+            layer = pygame.Surface(self.screen.get_size()).convert()
+            count("surface_alloc")
+            build(layer)
+            self.layer_builds += 1
+            self.layers[key] = layer
+            if len(self.layers) > self.max_layers:
+                self.layers.popitem(last=False)
+        else:
+            self.layers.move_to_end(key)
+        self.layer = layer
+
+        if self.full_redraw or key != self.layer_key:
+            self.layer_key = key
+            self.full_redraw = True
+            self.widgets = {}
+            self.sprite_rects = []
+            self.screen.blit(layer, (0, 0))
+        self.restored = self.sprite_rects
+        for rect in self.restored:
+            self.screen.blit(layer, rect, rect)
+            self.dirty.append(rect)
+        self.sprite_rects = []
+
+    def widget(self, name, key, draw):
+        """Redraw a widget when its key changed or sprites erased part of it"""
+        old = self.widgets.get(name)
+        if old is not None and not self.full_redraw:
+            old_key, old_rect = old
+            if old_key == key and (old_rect is None or old_rect.collidelist(self.restored) < 0):
+                return
+            if old_rect is not None:
+                self.screen.blit(self.layer, old_rect, old_rect)
+                self.dirty.append(old_rect)
+        rect = draw()
+        if rect is not None:
+            self.dirty.append(rect)
+        self.widgets[name] = (key, rect)
+
+    def sprites(self, rect):
+        """Mark a region drawn over everything this frame, erased next frame"""
+        if rect is not None:
+            self.sprite_rects.append(rect)
+            self.dirty.append(rect)
+
+    def present(self):
+        if self.full_redraw:
+            pygame.display.flip()
+        elif self.dirty:
+            pygame.display.update(self.dirty)
+        self.full_redraw = False
+        self.dirty = []
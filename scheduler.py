@@ -0,0 +1,75 @@
+import time
+from collections import deque
+import pygame
+
+ACTIVE = "active"
+IDLE = "idle"
+
+# Longest an idle screen blocks without an event before drawing again, so
+# changes made by background threads (corpus ready, adaptive refresh) show up
+IDLE_TIMEOUT = 0.5
+# Seconds of history behind the frame rate and CPU figures
+STATS_WINDOW = 2.0
+
+
+class FrameScheduler:
+    """Paces the main loop by mode.
+
+    ACTIVE (typing, particles, live overlay): one frame every 1/fps, with
+    input polled every poll_interval in between so keystrokes are stamped
+    on arrival. IDLE (static screens): block in pygame.event.wait until an
+    event arrives, a pygame timer fires, or IDLE_TIMEOUT passes, then draw
+    one frame. An idle menu costs a few wakeups a second instead of a core.
+    """
+
+    def __init__(self, fps, poll_interval, time_source=time.perf_counter, idle_timeout=IDLE_TIMEOUT):
+        self.frame_time = 1 / fps
+        self.poll_interval = poll_interval
+        self.time_source = time_source
+        self.idle_timeout = idle_timeout
+        self.mode = ACTIVE
+        self.frame_start = 0.0
+        self.frames = {ACTIVE: 0, IDLE: 0}
+        # (wall clock, process CPU, seconds spent in the frame) per frame
+        self.history = deque()
+
+    def begin_frame(self):
+        self.frame_start = self.time_source()
+
+    def end_frame(self, mode):
+        """Record the frame just drawn and the mode to wait in"""
+        self.mode = mode
+        self.frames[mode] += 1
+        now = time.perf_counter()
+        self.history.append((now, time.process_time(), self.time_source() - self.frame_start))
+        while now - self.history[0][0] > STATS_WINDOW:
+            self.history.popleft()
+
+    def wait(self, pump):
+        """Wait for the next frame; pump(event=None) queues pending input"""
+        if self.mode == IDLE:
+            event = pygame.event.wait(int(self.idle_timeout * 1000))
+            if event.type != pygame.NOEVENT:
+                pump(event)
+            return
+        deadline = self.frame_start + self.frame_time
+        while True:
+            pump()
+            remaining = deadline - self.time_source()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, self.poll_interval))
+
+    def stats(self):
+        """Current mode, frames/s, CPU % of one core and mean frame ms over the last STATS_WINDOW"""
+        history = self.history
+        if len(history) < 2:
+            return {"mode": self.mode, "fps": 0.0, "cpu_pct": 0.0, "frame_ms": 0.0}
+        wall = history[-1][0] - history[0][0]
+        cpu = history[-1][1] - history[0][1]
+        return {
+            "mode": self.mode,
+            "fps": (len(history) - 1) / wall if wall > 0 else 0.0,
+            "cpu_pct": 100 * cpu / wall if wall > 0 else 0.0,
+            "frame_ms": 1000 * sum(busy for _, _, busy in history) / len(history),
+        }
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import time
+from struct import Struct
+
+# Seconds to wait for another station's write lock before giving up
+LOCK_TIMEOUT = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    stars INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_by_difficulty ON scores (difficulty, score DESC);
+CREATE INDEX IF NOT EXISTS scores_by_score ON scores (score DESC);
+CREATE INDEX IF NOT EXISTS scores_by_player ON scores (name, created);
+CREATE INDEX IF NOT EXISTS scores_by_date ON scores (created);
+"""
+
+COLUMNS = "name, difficulty, score, stars, date"
+
+# Shared leaderboard snapshot: magic, sequence number (odd while being
+# written), payload length, then the boards as JSON
+SNAPSHOT_HEADER = Struct("<8sQQ")
+SNAPSHOT_MAGIC = b"TMLBSNAP"
+SNAPSHOT_SIZE = 64 * 1024
+# Rows per board kept in the snapshot
+SNAPSHOT_TOP = 10
+# Longest player name the game accepts, so ten rows per board fit the snapshot
+MAX_NAME_LENGTH = 20
+ALL_MODES = "*"
+# Seconds between checks for scores written through other connections
+# (other machines sharing the database), which don't touch our snapshot
+REMOTE_CHECK_INTERVAL = 1.0
+
+
+class ScoreStoreError(Exception):
+    pass
+
+
+class ScoreStore:
+    """High scores in SQLite, safe for many processes sharing one directory.
+
+    Every score is kept; the leaderboard is a top-K query. Writes run in
+    BEGIN IMMEDIATE transactions so concurrent stations serialize on the
+    database lock instead of overwriting each other's rows.
+    """
+
+    def __init__(self, path, legacy_json=None, snapshot=None):
+        """snapshot: path of the shared leaderboard file; must be on a local disk"""
+        self.path = path
+        self.snapshot = None
+        self.data_version = None
+        self.checked = time.monotonic()
+        if snapshot is not None:
+            try:
+                self.snapshot = LeaderboardSnapshot(snapshot)
+            except OSError as e:
+                print(f"Leaderboard snapshot disabled, reading scores from the database: {e}")
+        try:
+            self.conn = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+            self.conn.row_factory = sqlite3.Row
+            with self.transaction():
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        self.conn.execute(statement)
+                if legacy_json and self._count() == 0:
+                    self._import_json(legacy_json)
+                # Other machines may have saved scores since the snapshot was written
+                if self.snapshot is not None:
+                    self._publish()
+            self.data_version = self._data_version()
+        except sqlite3.Error as e:
+            raise ScoreStoreError(f"Could not open score store {path}: {e}") from e
+
+    def transaction(self):
+        return _Transaction(self.conn)
+
+    def _count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def _import_json(self, path):
+        """One-time import of the old typing_master_highscores.json board"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r') as f:
+                rows = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipped importing {path}: {e}")
+            return
+        if not isinstance(rows, list):
+            print(f"Skipped importing {path}: not a list of scores")
+            return
+        skipped = 0
+        for row in rows:
+            try:
+                self._insert(row["name"], row["difficulty"], row["score"], row["stars"], row["date"])
+            except (KeyError, TypeError, ValueError, sqlite3.IntegrityError):
+                skipped += 1
+        if skipped:
+            print(f"Skipped {skipped} malformed scores in {path}")
+
+    def _insert(self, name, difficulty, score, stars, date):
+        try:
+            created = time.mktime(time.strptime(date, "%Y-%m-%d %H:%M"))
+        except ValueError:
+            created = time.time()
+        self.conn.execute(
+            "INSERT INTO scores (name, difficulty, score, stars, date, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (name, difficulty, int(score), int(stars), date, created))
+
+    def add(self, name, difficulty, score, stars, date=None):
+        if date is None:
+            date = time.strftime("%Y-%m-%d %H:%M")
+        try:
+            with self.transaction():
+                self._insert(name, difficulty, score, stars, date)
+        except sqlite3.Error as e:
+            raise ScoreStoreError(f"Could not save score: {e}") from e
+        # Only once the score is committed; a failure here must not lose it
+        if self.snapshot is not None:
+            try:
+                with self.transaction():
+                    self._publish()
+            except (sqlite3.Error, ScoreStoreError) as e:
+                print(f"Could not update leaderboard snapshot: {e}")
+
+    def _publish(self):
+        """Rewrite the shared snapshot; runs inside a write transaction, which serializes writers"""
+        difficulties = [row["difficulty"] for row in self._query("SELECT DISTINCT difficulty FROM scores", ())]
+        boards = {ALL_MODES: self.top(SNAPSHOT_TOP)}
+        for difficulty in difficulties:
+            boards[difficulty] = self.top(SNAPSHOT_TOP, difficulty)
+        # Boards that don't fit are left out, last first; leaderboard() reads
+        # those from the database
+        while not self.snapshot.publish(boards):
+            boards.popitem()
+
+    def _data_version(self):
+        """Changes whenever another connection commits to the database"""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _republish_remote(self):
+        """Republish if another connection wrote; never waits for the write lock"""
+        version = self._data_version()
+        if version == self.data_version:
+            return
+        self.conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            with self.transaction():
+                self._publish()
+        except sqlite3.OperationalError:
+            return  # Locked by a writer, which publishes itself; retry next interval
+        finally:
+            self.conn.execute(f"PRAGMA busy_timeout = {LOCK_TIMEOUT * 1000}")
+        self.data_version = version
+
+    def poll(self):
+        """True if new scores were published since the last call.
+
+        Local processes publish when they save. Scores saved by other
+        machines are picked up by a PRAGMA data_version check at most every
+        REMOTE_CHECK_INTERVAL; otherwise this is a memory read.
+        """
+        if self.snapshot is None:
+            return False
+        now = time.monotonic()
+        if now - self.checked >= REMOTE_CHECK_INTERVAL:
+            self.checked = now
+            try:
+                self._republish_remote()
+            except (sqlite3.Error, ScoreStoreError) as e:
+                print(f"Could not refresh leaderboard: {e}")
+        return self.snapshot.poll()
+
+    def leaderboard(self, difficulty=None, k=SNAPSHOT_TOP):
+        """Top k scores from the shared snapshot, or from the database without one"""
+        if self.snapshot is None or k > SNAPSHOT_TOP:
+            return self.top(k, difficulty)
+        if self.snapshot.boards is None:
+            self.snapshot.poll()
+        boards = self.snapshot.boards
+        board = boards.get(ALL_MODES if difficulty is None else difficulty) if boards is not None else None
+        if board is None:
+            return self.top(k, difficulty)
+        return board[:k]
+
+    def _query(self, sql, params):
+        try:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+        except sqlite3.Error as e:
+            raise ScoreStoreError(f"Could not read scores: {e}") from e
+
+    def top(self, k=10, difficulty=None):
+        """Best k scores, overall or for one difficulty"""
+        if difficulty is None:
+            return self._query(f"SELECT {COLUMNS} FROM scores ORDER BY score DESC, id LIMIT ?", (k,))
+        return self._query(
+            f"SELECT {COLUMNS} FROM scores WHERE difficulty = ? ORDER BY score DESC, id LIMIT ?",
+            (difficulty, k))
+
+    def history(self, player=None, difficulty=None, since=None, limit=None):
+        """Every score matching the filters, newest first"""
+        where, params = [], []
+        if player is not None:
+            where.append("name = ?")
+            params.append(player)
+        if difficulty is not None:
+            where.append("difficulty = ?")
+            params.append(difficulty)
+        if since is not None:
+            where.append("created >= ?")
+            params.append(since)
+        sql = f"SELECT {COLUMNS} FROM scores"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return self._query(sql, params)
+
+    def close(self):
+        self.conn.close()
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+
+def snapshot_path(directory, db_path):
+    """Per-database snapshot file in a local directory.
+
+    The database may live on a network share; the snapshot must not, since
+    mmap pages are not kept coherent between machines.
+    """
+    key = hashlib.sha1(os.path.realpath(db_path).encode()).hexdigest()[:16]
+    return os.path.join(directory, f"leaderboard-{key}.snap")
+
+
+class LeaderboardSnapshot:
+    """Leaderboards in a memory-mapped file shared by the game processes on one machine.
+
+    The writer bumps the sequence number to odd, writes the payload, then
+    bumps it to even (a seqlock). Readers compare the sequence number with
+    the last one they decoded, so checking for new scores is a memory read
+    with no file I/O; a read that overlaps a write is retried on the next
+    poll. Writers must be serialized by the caller.
+    """
+
+    def __init__(self, path, size=SNAPSHOT_SIZE):
+        self.path = path
+        self.size = size
+        self.seen = None
+        self.boards = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def publish(self, boards):
+        """Write boards for every reader; False (and nothing written) if they don't fit"""
+        data = json.dumps(boards).encode()
+        if SNAPSHOT_HEADER.size + len(data) > self.size:
+            return False
+        magic, seq, length = SNAPSHOT_HEADER.unpack_from(self.map)
+        if magic != SNAPSHOT_MAGIC:
+            seq = 0
+        elif seq % 2 == 0 and self.map[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length] == data:
+            return True  # Unchanged; don't make every reader decode it again
+        seq += 1 if seq % 2 == 0 else 2
+        SNAPSHOT_HEADER.pack_into(self.map, 0, SNAPSHOT_MAGIC, seq, 0)
+        self.map[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + len(data)] = data
+        SNAPSHOT_HEADER.pack_into(self.map, 0, SNAPSHOT_MAGIC, seq + 1, len(data))
+        return True
+
+    def poll(self):
+        """Decode the snapshot if its version changed; True if boards were updated"""
+        magic, seq, length = SNAPSHOT_HEADER.unpack_from(self.map)
+        if magic != SNAPSHOT_MAGIC or seq == self.seen or seq % 2:
+            return False
+        data = self.map[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length]
+        if SNAPSHOT_HEADER.unpack_from(self.map)[1] != seq:
+            return False
+        try:
+            self.boards = json.loads(data)
+        except ValueError:
+            return False
+        self.seen = seq
+        return True
+
+    def close(self):
+        self.map.close()
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
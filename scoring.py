@@ -0,0 +1,89 @@
+"""Level rules and scoring, shared by the game and grade.py.
+
+Nothing here imports pygame, so graders and worker processes can score
+attempts exactly as the game does without a display.
+"""
+from typing_state import TypingState
+from keylog import KeystrokeLog, BACKSPACE
+
+LEVELS = {
+    1: {"sentence": "Hello Start typing to level up", "time_limit": 999, "req_acc": 70},
+    2: {"sentence": "The quick brown fox jumps", "time_limit": 60, "req_acc": 75},
+    3: {"sentence": "Python is great for coding", "time_limit": 50, "req_acc": 78},
+    4: {"sentence": "Practice daily for tech interviews", "time_limit": 45, "req_acc": 80},
+    5: {"sentence": "Django React fullstack projects rock", "time_limit": 40, "req_acc": 82},
+    6: {"sentence": "BTech grads build amazing portfolios", "time_limit": 35, "req_acc": 84},
+    7: {"sentence": "Mumbai coders type super fast now", "time_limit": 30, "req_acc": 86},
+    8: {"sentence": "Level up your typing speed mastery", "time_limit": 27, "req_acc": 88},
+    9: {"sentence": "You are almost a typing champion", "time_limit": 24, "req_acc": 90},
+    10: {"sentence": "Congratulations Master Typist Achieved", "time_limit": 20, "req_acc": 92}
+}
+
+DIFFICULTY_MODES = {
+    "Easy": {"time_mult": 1.5, "acc_mult": 0.8, "score_mult": 1},
+    "Medium": {"time_mult": 1.0, "acc_mult": 1.0, "score_mult": 1.5},
+    "Hard": {"time_mult": 0.7, "acc_mult": 1.2, "score_mult": 2}
+}
+
+
+def level_rules(level, difficulty, sentence=None):
+    """(required accuracy %, time limit in seconds) for a level's sentence"""
+    diff = DIFFICULTY_MODES[difficulty]
+    req_acc = LEVELS[level]["req_acc"] * diff["acc_mult"]
+    # Corpus passages can be longer than the built-in sentence
+    length_scale = max(1.0, len(sentence or "") / len(LEVELS[level]["sentence"]))
+    time_limit = LEVELS[level]["time_limit"] * diff["time_mult"] * length_scale
+    return req_acc, time_limit
+
+
+def level_score(accuracy, time_limit, time_used, difficulty, level):
+    base_score = int(accuracy * 10)
+    time_bonus = int((time_limit - time_used) * 5)
+    difficulty_mult = DIFFICULTY_MODES[difficulty]["score_mult"]
+    level_mult = level * 0.5
+    return int((base_score + time_bonus) * difficulty_mult * level_mult)
+
+
+def type_key(typing, keylog, char, t):
+    """Apply one keystroke (BACKSPACE or a character) to an attempt"""
+    if char == BACKSPACE:
+        typing.backspace()
+        keylog.record_backspace(t)
+        return
+    pos = typing.cursor
+    expected = typing.target[pos] if pos < len(typing.target) else ""
+    keylog.record(char, t, expected)
+    typing.type_char(char)
+
+
+def grade(typing, keylog, level, difficulty):
+    """Result of a finished attempt: the numbers the game shows and scores"""
+    req_acc, time_limit = level_rules(level, difficulty, typing.target)
+    accuracy = typing.accuracy
+    time_used = keylog.elapsed()
+    latency = keylog.latency_stats()
+    return {
+        "accuracy": accuracy,
+        "wpm": keylog.wpm(),
+        "time_used": time_used,
+        "req_acc": req_acc,
+        "time_limit": time_limit,
+        "score": level_score(accuracy, time_limit, time_used, difficulty, level),
+        "passed": accuracy >= req_acc,
+        "keys": len(keylog),
+        "mean_latency_ms": latency["mean"] * 1000,
+        "keystroke_accuracy": keylog.keystroke_accuracy(),
+    }
+
+
+def replay(target, typed, timings, mode="strict", end=None):
+    """(TypingState, KeystrokeLog) after replaying typed keys at timings (seconds from start)"""
+    if len(typed) != len(timings):
+        raise ValueError(f"{len(typed)} keys but {len(timings)} timings")
+    typing = TypingState(target, mode)
+    keylog = KeystrokeLog()
+    keylog.start(0.0)
+    for char, t in zip(typed, timings):
+        type_key(typing, keylog, char, t)
+    keylog.finish(end if end is not None else (timings[-1] if timings else 0.0))
+    return typing, keylog
@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from profiler import count
+
+# Upper bound on cached rendered strings (HUD lines, menu entries, names...)
+TEXT_CACHE_SIZE = 256
+
+
+class GlyphAtlas:
+    """Pre-rasterized glyphs for one font in a fixed set of colors"""
+
+    def __init__(self, font, colors, charset=None):
+        self.font = font
+        self.colors = tuple(colors)
+        self.glyphs = {color: {} for color in self.colors}
+        self.renders = 0
+        if charset is None:
+            charset = [chr(c) for c in range(32, 127)]
+        for color in self.colors:
+            for char in charset:
+                self._render(char, color)
+
+    def _render(self, char, color):
+        glyph = self.font.render(char, True, color)
+        count("font_render")
+        self.glyphs[color][char] = glyph
+        self.renders += 1
+        return glyph
+
+    def get(self, char, color):
+        """Glyph surface for char, rasterized on first use if not in the atlas"""
+        glyphs = self.glyphs.get(color)
+        if glyphs is None:
+            glyphs = self.glyphs[color] = {}
+        glyph = glyphs.get(char)
+        if glyph is None:
+            glyph = self._render(char, color)
+        return glyph
+
+
+class TextCache:
+    """LRU cache of rendered text surfaces keyed by (font, text, color)"""
+
+    def __init__(self, max_size=TEXT_CACHE_SIZE):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.atlases = {}
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, True, color)
+        count("font_render")
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def atlas(self, font, colors):
+        """Glyph atlas for font, built once per (font, colors) pair"""
+        key = (font, tuple(colors))
+        atlas = self.atlases.get(key)
+        if atlas is None:
+            atlas = self.atlases[key] = GlyphAtlas(font, colors)
+        return atlas
+
+    def clear(self):
+        self.surfaces.clear()
+        self.atlases.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self.surfaces),
+            "glyph_renders": sum(a.renders for a in self.atlases.values()),
+        }
@@ -1,33 +1,61 @@
 import sys
 import time
+STARTUP_T0 = time.perf_counter()
 import random
+import threading
+import importlib.util
 import pygame
-import json
 import os
-import numpy as np  # Add this import for proper sound generation
+import tempfile
 from pygame.locals import *
+from text_cache import TextCache
+from typing_state import TypingState, CORRECT, WRONG
+from keylog import KeystrokeLog, BACKSPACE, save_session
+from particles import ParticleSystem
+from renderer import LayeredRenderer
+from profiler import FrameProfiler, profiled, count
+from score_store import ScoreStore, ScoreStoreError, snapshot_path, MAX_NAME_LENGTH
+from paragraph import ParagraphLayout
+from scheduler import FrameScheduler, ACTIVE, IDLE
+from scoring import LEVELS, DIFFICULTY_MODES, level_rules, grade, type_key
 
-# File for high scores
+# Old JSON high scores, imported into the database on first run
 HIGH_SCORES_FILE = "typing_master_highscores.json"
+# Score database; point TYPING_SCORES_DIR at a shared directory for a whole lab
+SCORES_DIR = os.environ.get("TYPING_SCORES_DIR", ".")
+HIGH_SCORES_DB = "typing_master_highscores.db"
+# Memory-mapped top-10 boards shared by the game processes on this machine;
+# kept on local disk even when SCORES_DIR is a network share
+SNAPSHOT_DIR = os.environ.get("TYPING_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "typing_master_pro"))
+# Per-attempt keystroke logs for analytics.py; share it like SCORES_DIR
+SESSIONS_DIR = os.environ.get("TYPING_SESSIONS_DIR", "typing_sessions")
+# Optional passage corpus (see corpus.py); levels then draw passages from it
+CORPUS_FILE = os.environ.get("TYPING_CORPUS")
+# Longest passage a level asks for; the sentence area wraps and scrolls,
+# and level_rules scales the time limit with length
+SENTENCE_MAX_CHARS = 400
+# Extra characters per level: one line at level 1, several by level 10
+SENTENCE_CHARS_PER_LEVEL = 30
+# Synthesized beeps are cached here so later launches skip NumPy entirely
+SOUND_CACHE_DIR = os.environ.get("TYPING_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "typing_master_pro"))
+SAMPLE_RATE = 22050
+FPS = 60
+# Input is polled this often between frames so keystrokes are stamped on
+# arrival rather than at the next frame
+INPUT_POLL_INTERVAL = 0.001
+# Longest the main thread waits for a passage from a prefetch worker before
+# falling back to a generated or built-in one
+PASSAGE_WAIT = 1 / FPS
 
-LEVELS = {
-    1: {"sentence": "Hello Start typing to level up", "time_limit": 999, "req_acc": 70},
-    2: {"sentence": "The quick brown fox jumps", "time_limit": 60, "req_acc": 75},
-    3: {"sentence": "Python is great for coding", "time_limit": 50, "req_acc": 78},
-    4: {"sentence": "Practice daily for tech interviews", "time_limit": 45, "req_acc": 80},
-    5: {"sentence": "Django React fullstack projects rock", "time_limit": 40, "req_acc": 82},
-    6: {"sentence": "BTech grads build amazing portfolios", "time_limit": 35, "req_acc": 84},
-    7: {"sentence": "Mumbai coders type super fast now", "time_limit": 30, "req_acc": 86},
-    8: {"sentence": "Level up your typing speed mastery", "time_limit": 27, "req_acc": 88},
-    9: {"sentence": "You are almost a typing champion", "time_limit": 24, "req_acc": 90},
-    10: {"sentence": "Congratulations Master Typist Achieved", "time_limit": 20, "req_acc": 92}
-}
-
-DIFFICULTY_MODES = {
-    "Easy": {"time_mult": 1.5, "acc_mult": 0.8},
-    "Medium": {"time_mult": 1.0, "acc_mult": 1.0},
-    "Hard": {"time_mult": 0.7, "acc_mult": 1.2}
-}
+# Passage area on the playing screen: wrap width, visible lines, line pitch
+SENTENCE_WIDTH = 1100
+SENTENCE_ROWS = 10
+SENTENCE_LINE_HEIGHT = 26
+# Width of the input box text; longer input shows its last characters
+INPUT_WIDTH = 1040
+
+# Leaderboard views: all difficulties, then each one (LEFT/RIGHT on the board)
+LEADERBOARD_FILTERS = [None] + list(DIFFICULTY_MODES)
 
 SUPER_MOTIVATIONS = [
     "🚀 YOU ARE A TYPING ROCKET!",
@@ -41,18 +69,34 @@ SUPER_MOTIVATIONS = [
 ]
 
 class TypingTest:
-    def __init__(self):
-        pygame.init()
-        pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
+    def __init__(self, fast_start=None):
+        if fast_start is None:
+            fast_start = os.environ.get("TYPING_FAST_START", "") not in ("", "0")
+        self.fast_start = fast_start
+        self.startup_timings = [("import", time.perf_counter() - STARTUP_T0)]
+        self.startup_mark = time.perf_counter()
+        self.startup_reported = False
+        self.report_startup = bool(os.environ.get("TYPING_STARTUP_REPORT")) or "--startup-report" in sys.argv
+        
+        # Only the subsystems needed for the first frame; audio comes later
+        pygame.display.init()
+        pygame.font.init()
         
         self.w, self.h = 1200, 800
         self.screen = pygame.display.set_mode((self.w, self.h))
         pygame.display.set_caption('Typing Master Pro - Portfolio Edition')
-        self.clock = pygame.time.Clock()
+        self.record_startup("display")
+        # Monotonic, high resolution; immune to wall-clock adjustments
+        self.time_source = time.perf_counter
+        self.scheduler = FrameScheduler(FPS, INPUT_POLL_INTERVAL, lambda: self.time_source())
+        self.input_queue = []
+        self.profiler = FrameProfiler.from_env()
+        self.renderer = LayeredRenderer(self.screen)
         self.font = pygame.font.Font(None, 36)
         self.small_font = pygame.font.Font(None, 24)
         self.title_font = pygame.font.Font(None, 60)
         self.big_font = pygame.font.Font(None, 48)
+        self.record_startup("fonts")
         
         # Colors
         self.bg_color = (5, 5, 25)
@@ -63,15 +107,21 @@ class TypingTest:
         self.glow_color = (100, 255, 255)
         self.trophy_gold = (255, 215, 0)
         
+        # Rendered text and glyph cache (the sentence atlas is built on first use)
+        self.text_cache = TextCache()
+        
         # Game states
         self.difficulty = "Medium"
         self.player_name = ""
         self.game_state = "menu"
-        self.high_scores = self.load_high_scores()
+        self.score_store = self.open_score_store()
+        self.leaderboard_cache = {}
+        self.leaderboard_filter = None
+        self.scores_version = 0
+        self.record_startup("score store")
         self.sounds_loaded = False
-        
-        # Load sounds safely
-        self.load_sounds()
+        self.sounds_muted = False
+        self.click_sound = self.success_sound = self.level_up_sound = self.game_win_sound = None
         
         # Game variables
         self.level = 1
@@ -79,20 +129,100 @@ class TypingTest:
         self.sentence = LEVELS[1]["sentence"]
         self.req_acc = LEVELS[1]["req_acc"]
         self.time_limit = LEVELS[1]["time_limit"]
-        self.input_text = ""
+        self.typing_mode = "strict"
+        self.adaptive = False
+        self.adaptive_prefetcher = None
+        self.typing = TypingState(self.sentence, self.typing_mode)
+        self.sentence_layout = None
+        self.sentence_top = 0
         self.active = False
         self.show_results = False
         self.game_won = False
         self.start_time = 0
         self.time_used = 0.0
+        self.keylog = KeystrokeLog()
+        self.key_stats = None
         self.accuracy = 0.0
         self.wpm = 0.0
         self.total_score = 0
-        self.particles = []
+        self.level_score = 0
+        self.particles = ParticleSystem()
         self.motivation_msg = ""
         self.stars_count = 0
         self.menu_selection = 0
         self.running = True
+        
+        # Passage corpus, prefetching the next level's passage in the background
+        self.prefetcher = None
+        if CORPUS_FILE:
+            self.open_corpus(CORPUS_FILE)
+        self.record_startup("game state")
+        
+        # Load sounds safely; in fast-start mode the first frame doesn't wait
+        if self.fast_start:
+            threading.Thread(target=self.init_audio, name="audio-init", daemon=True).start()
+        else:
+            self.init_audio()
+
+    def record_startup(self, phase):
+        now = time.perf_counter()
+        self.startup_timings.append((phase, now - self.startup_mark))
+        self.startup_mark = now
+
+    def startup_report(self):
+        lines = [f"  {phase:<20} {seconds * 1000:8.1f} ms" for phase, seconds in self.startup_timings]
+        return "Startup timing:\n" + "\n".join(lines)
+
+    def init_audio(self):
+        start = time.perf_counter()
+        try:
+            pygame.mixer.init(frequency=SAMPLE_RATE, size=-16, channels=2, buffer=512)
+        except pygame.error as e:
+            print(f"Sound effects disabled - {e}")
+            return
+        self.load_sounds()
+        if self.fast_start:
+            seconds = time.perf_counter() - start
+            self.startup_timings.append(("audio (background)", seconds))
+            if self.report_startup:
+                print(f"  {'audio (background)':<20} {seconds * 1000:8.1f} ms")
+        else:
+            self.record_startup("audio")
+
+    def open_corpus(self, path):
+        from corpus import open_corpus, CorpusError  # NumPy-backed, loaded only when used
+        try:
+            corpus = open_corpus(path, on_ready=self.use_corpus)
+        except CorpusError as e:
+            print(f"Corpus disabled: {e}")
+            return
+        if corpus is not None:
+            self.use_corpus(corpus)
+
+    def use_corpus(self, corpus):
+        from corpus import PassagePrefetcher
+        self.prefetcher = PassagePrefetcher(corpus)
+
+    def open_adaptive(self):
+        """Start the adaptive passage source; analytics are loaded on its worker"""
+        from functools import partial
+        from analytics import TypingAnalytics
+        from adaptive import AdaptivePassages
+        from corpus import PassagePrefetcher
+        corpus = self.prefetcher.corpus if self.prefetcher is not None else None
+        vocabulary = [word for level in LEVELS.values() for word in level["sentence"].lower().split()]
+        source = AdaptivePassages(partial(TypingAnalytics, SESSIONS_DIR), corpus, vocabulary)
+        self.adaptive_prefetcher = PassagePrefetcher(source)
+        self.adaptive_prefetcher.run(source.refresh)
+
+    def refresh_adaptive(self):
+        """Pick up the attempt just saved before choosing the next passage"""
+        if self.adaptive_prefetcher is not None:
+            self.adaptive_prefetcher.run(self.adaptive_prefetcher.corpus.refresh)
+
+    @property
+    def input_text(self):
+        return self.typing.text
 
     def load_sounds(self):
         """Load sound effects safely with fallback"""
@@ -103,193 +233,341 @@ class TypingTest:
             self.game_win_sound = pygame.mixer.Sound("win.wav")
             self.sounds_loaded = True
         except:
-            # Create simple beeps using numpy
+            # Create simple beeps (cached on disk, synthesized with numpy on a miss)
             try:
-                self.click_sound = self.create_beep(800, 0.05)
-                self.success_sound = self.create_beep(1000, 0.15)
-                self.level_up_sound = self.create_beep(1200, 0.25)
-                self.game_win_sound = self.create_beep(1500, 0.4)
+                self.click_sound = self.cached_beep(800, 0.05)
+                self.success_sound = self.cached_beep(1000, 0.15)
+                self.level_up_sound = self.cached_beep(1200, 0.25)
+                self.game_win_sound = self.cached_beep(1500, 0.4)
                 self.sounds_loaded = True
             except:
                 self.sounds_loaded = False
                 print("Sound effects disabled - no numpy available")
 
-    def create_beep(self, freq, duration):
-        sample_rate = 22050
+    def cached_beep(self, freq, duration):
+        """Beep from the on-disk cache, keyed by (freq, duration) and the mixer's format.
+
+        The mixer may not open at the rate and channels asked for, so the key
+        comes from pygame.mixer.get_init(), the format the raw bytes are in.
+        """
+        sample_rate, size, channels = pygame.mixer.get_init()
+        path = os.path.join(SOUND_CACHE_DIR, f"beep_{freq}_{duration}_{sample_rate}_{size}_{channels}ch.raw")
+        try:
+            with open(path, 'rb') as f:
+                return pygame.mixer.Sound(buffer=f.read())
+        except OSError:
+            pass
+        sound = self.create_beep(freq, duration, sample_rate, channels)
+        try:
+            os.makedirs(SOUND_CACHE_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(sound.get_raw())
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Could not cache sound: {e}")
+        return sound
+
+    def create_beep(self, freq, duration, sample_rate=SAMPLE_RATE, channels=2):
+        import numpy as np  # only needed when the sound cache is cold
         frames = int(duration * sample_rate)
         arr = np.sin(2 * np.pi * freq * np.linspace(0, duration, frames))
         arr = (arr * 32767).astype(np.int16)
-        arr = np.column_stack((arr, arr))  # Stereo fix
+        if channels > 1:
+            arr = np.column_stack([arr] * channels)  # One column per mixer channel
         sound = pygame.sndarray.make_sound(arr)
         return sound
 
 
     def play_sound(self, sound):
         """Safely play sound"""
-        if self.sounds_loaded:
+        if self.sounds_loaded and not self.sounds_muted:
             try:
                 sound.play()
             except:
                 pass
 
-    def load_high_scores(self):
-        if os.path.exists(HIGH_SCORES_FILE):
-            try:
-                with open(HIGH_SCORES_FILE, 'r') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
+    def open_score_store(self):
+        try:
+            db = os.path.join(SCORES_DIR, HIGH_SCORES_DB)
+            return ScoreStore(db, legacy_json=HIGH_SCORES_FILE, snapshot=snapshot_path(SNAPSHOT_DIR, db))
+        except ScoreStoreError as e:
+            print(f"High scores disabled: {e}")
+            return None
+
+    def load_high_scores(self, difficulty=None):
+        """Top 10 scores for the leaderboard, cached until any process saves a score"""
+        if difficulty in self.leaderboard_cache:
+            return self.leaderboard_cache[difficulty]
+        if self.score_store is None:
+            return []
+        try:
+            scores = self.score_store.leaderboard(difficulty, 10)
+        except ScoreStoreError as e:
+            print(e)
+            return []
+        self.leaderboard_cache[difficulty] = scores
+        return scores
 
     def save_high_score(self):
-        score_data = {
-            "name": self.player_name,
-            "difficulty": self.difficulty,
-            "score": self.total_score,
-            "stars": self.stars_count,
-            "date": time.strftime("%Y-%m-%d %H:%M")
-        }
-        self.high_scores.append(score_data)
-        self.high_scores.sort(key=lambda x: x['score'], reverse=True)
-        self.high_scores = self.high_scores[:10]
+        if self.score_store is None:
+            print("Could not save high score: no score store")
+            return
         try:
-            with open(HIGH_SCORES_FILE, 'w') as f:
-                json.dump(self.high_scores, f, indent=2)
-        except:
-            print("Could not save high score")
+            self.score_store.add(self.player_name, self.difficulty, self.total_score, self.stars_count)
+        except ScoreStoreError as e:
+            print(e)
+            return
+        self.leaderboard_cache.clear()
+        self.scores_version += 1
+
+    def poll_high_scores(self):
+        """Pick up scores saved by other processes; a version check in shared memory"""
+        if self.score_store is not None and self.score_store.poll():
+            self.leaderboard_cache.clear()
+            self.scores_version += 1
 
-    def draw_text(self, text, x, y, color, font=None):
+    def draw_text(self, text, x, y, color, font=None, target=None):
         if font is None:
             font = self.font
-        surface = font.render(str(text), True, color)
-        self.screen.blit(surface, (x, y))
+        if target is None:
+            target = self.screen
+        surface = self.text_cache.render(font, str(text), color)
+        return target.blit(surface, (x, y))
 
-    def draw_centered_text(self, text, y, color, font=None):
+    def draw_centered_text(self, text, y, color, font=None, target=None):
         if font is None:
             font = self.font
-        surface = font.render(str(text), True, color)
+        if target is None:
+            target = self.screen
+        surface = self.text_cache.render(font, str(text), color)
         rect = surface.get_rect(center=(self.w//2, y))
-        self.screen.blit(surface, rect)
+        return target.blit(surface, rect)
 
-    def draw_menu(self):
-        overlay = pygame.Surface((self.w, self.h))
-        overlay.set_alpha(200)
-        overlay.fill((20, 20, 60))
-        self.screen.blit(overlay, (0, 0))
+    def draw_overlay(self, target, alpha, color):
+        overlay = pygame.Surface(target.get_size())
+        count("surface_alloc")
+        overlay.set_alpha(alpha)
+        overlay.fill(color)
+        target.blit(overlay, (0, 0))
+
+    def header_text(self):
+        if self.player_name:
+            return f"Player: {self.player_name} | Score: {self.total_score}"
+        return ""
+
+    def draw_background(self, target):
+        target.fill(self.bg_color)
+        if self.player_name:
+            self.draw_centered_text(self.header_text(), 30, self.heading_color, self.small_font, target)
+
+    @profiled
+    def draw_menu(self, target):
+        self.draw_background(target)
+        self.draw_overlay(target, 200, (20, 20, 60))
         
-        self.draw_centered_text("🎮 TYPING MASTER PRO 🎮", 120, self.heading_color, self.title_font)
-        self.draw_centered_text("Choose Difficulty", 200, self.glow_color, self.big_font)
+        self.draw_centered_text("🎮 TYPING MASTER PRO 🎮", 120, self.heading_color, self.title_font, target)
+        self.draw_centered_text("Choose Difficulty", 200, self.glow_color, self.big_font, target)
         
         modes = list(DIFFICULTY_MODES.keys())
         for i, mode in enumerate(modes):
             color = self.trophy_gold if i == self.menu_selection else self.glow_color
-            self.draw_centered_text(f"[{'>' if i == self.menu_selection else ' '}] {mode}", 300 + i*60, color, self.big_font)
+            self.draw_centered_text(f"[{'>' if i == self.menu_selection else ' '}] {mode}", 300 + i*60, color, self.big_font, target)
         
-        self.draw_centered_text("ENTER = Select | ARROW KEYS = Navigate", 500, (0, 255, 255))
-        self.draw_centered_text("L = Leaderboard | SPACE = Skip Sounds", 550, (255, 215, 0))
-
-    def draw_leaderboard(self):
-        overlay = pygame.Surface((self.w, self.h))
-        overlay.set_alpha(240)
-        overlay.fill((15, 25, 50))
-        self.screen.blit(overlay, (0, 0))
+        self.draw_centered_text("ENTER = Select | ARROW KEYS = Navigate", 500, (0, 255, 255), None, target)
+        self.draw_centered_text("L = Leaderboard | SPACE = Skip Sounds", 550, (255, 215, 0), None, target)
+        adaptive = "On" if self.adaptive else "Off"
+        self.draw_centered_text(f"M = Typing Mode: {self.typing_mode.title()} | A = Adaptive: {adaptive}", 600, (200, 255, 200), self.small_font, target)
+
+    @profiled
+    def draw_leaderboard(self, target):
+        self.draw_background(target)
+        self.draw_overlay(target, 240, (15, 25, 50))
         
-        self.draw_centered_text("🏆 GLOBAL LEADERBOARD 🏆", 100, self.trophy_gold, self.title_font)
+        self.draw_centered_text("🏆 GLOBAL LEADERBOARD 🏆", 100, self.trophy_gold, self.title_font, target)
+        self.draw_centered_text(f"< {self.leaderboard_filter or 'All Modes'} >", 180, self.glow_color, self.small_font, target)
         
-        if not self.high_scores:
-            self.draw_centered_text("No scores yet! Be the first!", 350, self.glow_color)
+        high_scores = self.load_high_scores(self.leaderboard_filter)
+        if not high_scores:
+            self.draw_centered_text("No scores yet! Be the first!", 350, self.glow_color, None, target)
         else:
             y_offset = 250
-            for i, score in enumerate(self.high_scores[:10]):
+            for i, score in enumerate(high_scores):
                 rank_color = self.trophy_gold if i == 0 else self.glow_color if i < 3 else self.text_color
                 line = f"{i+1}. {score['name']} - {score['score']}pts ({score['difficulty']}) ⭐{score['stars']}"
-                self.draw_text(line, 100, y_offset + i*35, rank_color)
+                self.draw_text(line, 100, y_offset + i*35, rank_color, None, target)
         
-        self.draw_centered_text("ESC = Back", self.h - 100, (0, 255, 255))
+        self.draw_centered_text("ESC = Back", self.h - 100, (0, 255, 255), None, target)
 
-    def draw_name_entry(self):
-        overlay = pygame.Surface((self.w, self.h))
-        overlay.set_alpha(200)
-        overlay.fill((20, 20, 60))
-        self.screen.blit(overlay, (0, 0))
+    @profiled
+    def draw_name_entry(self, target):
+        self.draw_background(target)
+        self.draw_overlay(target, 200, (20, 20, 60))
         
-        self.draw_centered_text(f"🎮 {self.difficulty} MODE 🎮", 150, self.heading_color, self.title_font)
-        self.draw_centered_text("Enter your name:", 250, self.glow_color, self.big_font)
+        self.draw_centered_text(f"🎮 {self.difficulty} MODE 🎮", 150, self.heading_color, self.title_font, target)
+        self.draw_centered_text("Enter your name:", 250, self.glow_color, self.big_font, target)
         
-        pygame.draw.rect(self.screen, self.glow_color, (400, 350, 400, 60), 4)
+        pygame.draw.rect(target, self.glow_color, (400, 350, 400, 60), 4)
         name_display = self.player_name if self.player_name else "Type your name here..."
-        self.draw_centered_text(name_display, 385, self.text_color)
+        self.draw_centered_text(name_display, 385, self.text_color, None, target)
+        
+        self.draw_centered_text("Press ENTER to start!", 480, (0, 255, 255), None, target)
+
+    @profiled
+    def draw_playing(self, target):
+        """Static part of the playing screen"""
+        self.draw_background(target)
+        self.draw_centered_text(f"Level {self.level}/{self.max_level} | {self.difficulty} ⭐{self.stars_count}", 60, self.heading_color, self.big_font, target)
+        self.draw_text("Type exactly:", 50, 170, self.text_color, None, target)
+        pygame.draw.rect(target, self.glow_color, (50, 500, 1100, 60), 4)
+        self.draw_text("ENTER=FINISH | Backspace OKAY | Click results to LEVEL UP! | ESC=Menu", 50, 700, (200, 255, 200), self.small_font, target)
+
+    def status_text(self):
+        if self.active and not self.show_results:
+            time_elapsed = self.time_source() - self.start_time
+            time_left = max(0, self.time_limit - time_elapsed)
+            return f"Time: {time_left:.1f}s | Goal: {self.req_acc:.0f}% | Score: {self.total_score}"
+        return f"Goal: {self.req_acc:.0f}% accuracy | Score: {self.total_score}"
+
+    @profiled
+    def draw_status(self, target=None):
+        return self.draw_centered_text(self.status_text(), 110, self.text_color, None, target)
+
+    @profiled
+    def draw_input(self, target=None):
+        typed = self.typing.typed
+        if not typed:
+            return self.draw_text("Click to unleash your typing power...", 70, 520, self.text_color, None, target)
+        # Only the tail that fits in the box, without joining the whole input
+        glyphs = self.text_cache.atlas(self.font, (self.text_color,))
+        width, start = 0, len(typed)
+        while start > 0:
+            width += glyphs.get(typed[start - 1], self.text_color).get_width()
+            if width > INPUT_WIDTH:
+                break
+            start -= 1
+        return self.draw_text("".join(typed[start:]), 70, 520, self.text_color, None, target)
+
+    def draw_playing_frozen(self, target):
+        """Playing screen with its dynamic parts baked in, under an overlay"""
+        self.draw_playing(target)
+        self.draw_status(target)
+        self.draw_sentence_highlighted(50, 210, target)
+        self.draw_input(target)
+
+    @profiled
+    def draw_results(self, target):
+        self.draw_playing_frozen(target)
+        self.draw_overlay(target, 220, (15, 30, 70))
         
-        self.draw_centered_text("Press ENTER to start!", 480, (0, 255, 255))
+        self.draw_centered_text(f"🎉 LEVEL {self.level} CRUSHED! 🎉", self.h//2 - 140, self.heading_color, self.title_font, target)
+        self.draw_centered_text(self.motivation_msg, self.h//2 - 80, self.glow_color, self.big_font, target)
+        self.draw_centered_text(f"Accuracy: {self.accuracy:.1f}%", self.h//2 - 20, self.correct_color, None, target)
+        self.draw_centered_text(f"WPM: {self.wpm:.1f}", self.h//2 + 30, self.correct_color, None, target)
+        self.draw_centered_text(f"Time: {self.time_used:.2f}s (+{self.level_score}pts)", self.h//2 + 80, self.correct_color, None, target)
+        if self.key_stats:
+            keys, gap_ms, key_acc = self.key_stats
+            self.draw_centered_text(f"{keys} keys | avg gap {gap_ms:.0f} ms | keystroke accuracy {key_acc:.1f}%", self.h//2 + 120, self.text_color, self.small_font, target)
+        self.draw_centered_text("👆 CLICK TO DOMINATE NEXT LEVEL 👆", self.h//2 + 160, self.glow_color, None, target)
 
-    def draw_sentence_highlighted(self, x, y):
-        correct_chars = sum(1 for i, c in enumerate(self.sentence) if i < len(self.input_text) and self.input_text[i] == c)
-        live_accuracy = (correct_chars / len(self.sentence)) * 100 if self.sentence else 0
+    @profiled
+    def draw_game_won(self, target):
+        self.draw_playing_frozen(target)
+        self.draw_overlay(target, 240, (20, 20, 60))
         
-        for i, char in enumerate(self.sentence):
-            if i < len(self.input_text):
-                color = self.correct_color if self.input_text[i] == char else self.error_color
-            else:
-                color = self.text_color
-            self.draw_text(char, x + i * 20, y, color, self.small_font)
+        for i in range(5):
+            pygame.draw.circle(target, self.trophy_gold, 
+                             (self.w//2 + i*30 - 120, self.h//2 - 150), 40 + i*5)
+        
+        self.draw_centered_text("🏆🏆🏆 TYPING LEGEND! 🏆🏆🏆", self.h//2 - 120, self.trophy_gold, self.title_font, target)
+        self.draw_centered_text(f"{self.player_name} - {self.total_score}pts", self.h//2 - 50, self.heading_color, self.big_font, target)
+        self.draw_centered_text(f"{self.difficulty} Mode ⭐{self.stars_count}", self.h//2 + 20, self.glow_color, None, target)
+        self.draw_centered_text("ESC = Main Menu", self.h//2 + 140, (0, 255, 255), None, target)
+
+    @profiled
+    def draw_sentence_highlighted(self, x, y, target=None):
+        if target is None:
+            target = self.screen
+        live_accuracy = self.typing.accuracy
+        status = self.typing.status
+        
+        glyphs = self.text_cache.atlas(self.small_font, (self.text_color, self.correct_color, self.error_color))
+        layout = self.layout_sentence(glyphs)
+        top = self.sentence_top = layout.scroll(self.typing.cursor, self.sentence_top, SENTENCE_ROWS)
+        xs = layout.x
+        sentence = self.sentence
+        blits = []
+        for line in range(top, min(len(layout), top + SENTENCE_ROWS)):
+            line_y = y + (line - top) * SENTENCE_LINE_HEIGHT
+            start, end = layout.line_range(line)
+            for i in range(start, end):
+                if status[i] == CORRECT:
+                    color = self.correct_color
+                elif status[i] == WRONG:
+                    color = self.error_color
+                else:
+                    color = self.text_color
+                blits.append((glyphs.get(sentence[i], color), (x + xs[i], line_y)))
+        rects = target.blits(blits)
         
-        self.draw_centered_text(f"{live_accuracy:.0f}%", 280, self.glow_color)
+        rect = self.draw_centered_text(f"{live_accuracy:.0f}%", 185, self.glow_color, None, target)
+        return rect.unionall(rects) if rects else rect
+
+    def layout_sentence(self, glyphs):
+        """Word-wrap layout of the current sentence, built once per passage"""
+        layout = self.sentence_layout
+        if layout is None or layout.text != self.sentence:
+            layout = self.sentence_layout = ParagraphLayout(
+                self.sentence, lambda char: glyphs.get(char, self.text_color).get_width(), SENTENCE_WIDTH)
+            self.sentence_top = 0
+        return layout
 
     def create_explosion(self, x, y):
-        for _ in range(100):
-            self.particles.append({
-                'x': x, 'y': y,
-                'vx': random.uniform(-12, 12),
-                'vy': random.uniform(-15, -3),
-                'life': 90,
-                'size': random.randint(3, 8)
-            })
+        self.particles.emit(x, y, 100)
         self.play_sound(self.level_up_sound)
 
+    @profiled
     def update_particles(self):
-        for p in self.particles[:]:
-            p['x'] += p['vx']
-            p['y'] += p['vy']
-            p['vy'] += 0.2
-            p['life'] -= 1
-            if p['life'] <= 0:
-                self.particles.remove(p)
+        self.particles.update()
 
+    @profiled
     def draw_particles(self):
-        for p in self.particles:
-            alpha = int(255 * (p['life'] / 90))
-            size = int(p['size'] * (p['life'] / 90))
-            if size > 0:
-                s = pygame.Surface((size*2, size*2), pygame.SRCALPHA)
-                pygame.draw.circle(s, (255, 215, 0, alpha), (size, size), size)
-                self.screen.blit(s, (int(p['x']-size), int(p['y']-size)))
-
-    def calculate_score(self):
-        base_score = int(self.accuracy * 10)
-        time_bonus = int((self.time_limit - self.time_used) * 5)
-        difficulty_mult = {"Easy": 1, "Medium": 1.5, "Hard": 2}[self.difficulty]
-        level_mult = self.level * 0.5
-        return int((base_score + time_bonus) * difficulty_mult * level_mult)
-
-    def check_level_complete(self):
-        self.time_used = time.time() - self.start_time
+        self.renderer.sprites(self.particles.draw(self.screen))
+
+    def check_level_complete(self, stamp=None):
+        if stamp is None:
+            stamp = self.time_source()
+        self.keylog.finish(stamp)
         self.active = False
         
-        correct_chars = sum(1 for i, c in enumerate(self.sentence) if i < len(self.input_text) and self.input_text[i] == c)
-        self.accuracy = (correct_chars / len(self.sentence)) * 100
-        self.wpm = (len(self.input_text) / 5) / (self.time_used / 60)
+        result = grade(self.typing, self.keylog, self.level, self.difficulty)
+        self.time_used = result["time_used"]
+        self.accuracy = result["accuracy"]
+        self.wpm = result["wpm"]
+        self.key_stats = (result["keys"], result["mean_latency_ms"], result["keystroke_accuracy"])
         
-        level_score = self.calculate_score()
-        self.total_score += level_score
+        self.level_score = result["score"]
+        self.total_score += self.level_score
+        self.save_session(result["passed"])
+        self.refresh_adaptive()
         
-        if self.accuracy >= self.req_acc:
+        if result["passed"]:
             self.show_results = True
             self.play_sound(self.success_sound)
             self.create_explosion(self.w//2, self.h//2)
             self.motivation_msg = random.choice(SUPER_MOTIVATIONS)
             self.stars_count += 1
+            self.prefetch_level(self.level + 1)
         else:
-            self.input_text = ""
+            self.typing.reset()
+
+    def save_session(self, passed):
+        try:
+            save_session(SESSIONS_DIR, self.keylog, player=self.player_name, difficulty=self.difficulty,
+                         level=self.level, start=time.time() - self.time_used, wpm=round(self.wpm, 2),
+                         accuracy=round(self.accuracy, 2), passed=passed)
+        except OSError as e:
+            print(f"Could not save session: {e}")
 
     def next_level(self):
         if self.level >= self.max_level:
@@ -299,145 +577,210 @@ class TypingTest:
             self.create_explosion(self.w//2, self.h//2)
             return
         
-        self.level += 1
-        self.sentence = LEVELS[self.level]["sentence"]
-        diff = DIFFICULTY_MODES[self.difficulty]
-        self.req_acc = LEVELS[self.level]["req_acc"] * diff["acc_mult"]
-        self.time_limit = LEVELS[self.level]["time_limit"] * diff["time_mult"]
-        self.input_text = ""
+        self.load_level(self.level + 1)
+        self.particles.clear()
+
+    def load_level(self, level):
+        self.level = level
+        self.sentence = self.level_sentence(level)
+        self.req_acc, self.time_limit = level_rules(level, self.difficulty, self.sentence)
+        self.typing.reset(self.sentence)
         self.active = False
         self.show_results = False
-        self.particles = []
+
+    def corpus_criteria(self, level):
+        """Passage filters for a level: longer, harder text as levels go up"""
+        from corpus import LOWER, UPPER, ASCII_TEXT
+        max_len = min(SENTENCE_MAX_CHARS, 25 + level * SENTENCE_CHARS_PER_LEVEL)
+        return {
+            "min_len": max_len * 2 // 3,
+            "max_len": max_len,
+            "charset": LOWER | UPPER if level <= 3 else ASCII_TEXT,
+            "max_difficulty": 0.2 + level * 0.08,
+        }
+
+    def level_sentence(self, level):
+        if self.adaptive and self.adaptive_prefetcher is not None:
+            criteria = self.corpus_criteria(level)
+            passage = self.adaptive_prefetcher.get((self.player_name, level), timeout=PASSAGE_WAIT,
+                                                   player=self.player_name, **criteria)
+            if passage:
+                return passage
+            # The worker is still busy (first analytics load, a refresh)
+            result = self.adaptive_prefetcher.corpus.generate_now(player=self.player_name, **criteria)
+            if result:
+                return result[1]
+        if self.prefetcher is not None:
+            passage = self.prefetcher.get(level, timeout=PASSAGE_WAIT, **self.corpus_criteria(level))
+            if passage:
+                return passage
+        return LEVELS[level]["sentence"]
+
+    def prefetch_level(self, level):
+        """Start picking a level's passage while the current screen is shown"""
+        if level not in LEVELS:
+            return
+        if self.adaptive and self.adaptive_prefetcher is not None and self.player_name:
+            self.adaptive_prefetcher.prefetch((self.player_name, level), player=self.player_name,
+                                              **self.corpus_criteria(level))
+        if self.prefetcher is not None:
+            self.prefetcher.prefetch(level, **self.corpus_criteria(level))
 
     def run(self):
         while self.running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.running = False
-                elif event.type == pygame.MOUSEBUTTONDOWN:
-                    if self.game_state == "playing":
-                        if not self.active and not self.show_results and not self.game_won:
-                            self.active = True
-                            self.start_time = time.time()
-                        elif self.show_results:
-                            self.next_level()
-                elif event.type == pygame.KEYDOWN:
-                    if self.game_state == "menu":
-                        if event.key == pygame.K_RETURN:
-                            self.difficulty = list(DIFFICULTY_MODES.keys())[self.menu_selection]
-                            self.game_state = "name_entry"
-                        elif event.key == pygame.K_UP:
-                            self.menu_selection = (self.menu_selection - 1) % len(DIFFICULTY_MODES)
-                        elif event.key == pygame.K_DOWN:
-                            self.menu_selection = (self.menu_selection + 1) % len(DIFFICULTY_MODES)
-                        elif event.key == pygame.K_l:
-                            self.game_state = "leaderboard"
-                        elif event.key == pygame.K_SPACE:
-                            self.sounds_loaded = False
-                        self.play_sound(self.click_sound)
-                        
-                    elif self.game_state == "name_entry":
-                        if event.key == pygame.K_RETURN and self.player_name.strip():
-                            self.game_state = "playing"
-                            self.level = 1
-                            self.sentence = LEVELS[1]["sentence"]
-                            diff = DIFFICULTY_MODES[self.difficulty]
-                            self.req_acc = LEVELS[1]["req_acc"] * diff["acc_mult"]
-                            self.time_limit = LEVELS[1]["time_limit"] * diff["time_mult"]
-                            self.input_text = ""
-                            self.active = False
-                            self.show_results = False
-                            self.game_won = False
-                            self.total_score = 0
-                            self.stars_count = 0
-                        elif event.key == pygame.K_BACKSPACE:
-                            self.player_name = self.player_name[:-1]
-                        elif event.key != pygame.K_ESCAPE:
-                            self.player_name += event.unicode
-                            
-                    elif self.game_state == "playing":
-                        if self.active and not self.show_results:
-                            if event.key == pygame.K_RETURN:
-                                self.check_level_complete()
-                            elif event.key == pygame.K_BACKSPACE:
-                                self.input_text = self.input_text[:-1]
-                                self.play_sound(self.click_sound)
-                            else:
-                                self.input_text += event.unicode
-                                self.play_sound(self.click_sound)
-                    elif event.key == pygame.K_ESCAPE:
-                        if self.game_state in ["playing", "game_won", "leaderboard", "name_entry"]:
-                            self.game_state = "menu"
-                            self.menu_selection = 1
-
-            self.screen.fill(self.bg_color)
-            
-            if self.player_name:
-                self.draw_centered_text(f"Player: {self.player_name} | Score: {self.total_score}", 30, self.heading_color, self.small_font)
-            
+            self.scheduler.begin_frame()
+            self.profiler.begin_frame()
+            with self.profiler.phase("events"):
+                self.pump_input()
+                for stamp, event in self.input_queue:
+                    self.handle_event(event, stamp)
+                self.input_queue.clear()
+            self.render_frame()
+            self.scheduler.end_frame(self.frame_mode())
+            self.profiler.end_frame(self.scheduler.stats() if self.profiler.enabled else None)
+            self.scheduler.wait(self.pump_input)
+        self.profiler.close()
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        if self.adaptive_prefetcher is not None:
+            self.adaptive_prefetcher.close()
+
+    def pump_input(self, first=None):
+        """Queue pending events (after first, if given), stamped with the time they were picked up"""
+        events = pygame.event.get()
+        if first is not None:
+            events.insert(0, first)
+        if events:
+            now = self.time_source()
+            self.input_queue.extend((now, event) for event in events)
+
+    def frame_mode(self):
+        """ACTIVE while typing or anything animates, IDLE on screens that only change on input"""
+        typing = self.game_state == "playing" and self.active and not self.show_results
+        if typing or len(self.particles) or self.profiler.show_overlay:
+            return ACTIVE
+        return IDLE
+
+    def handle_event(self, event, stamp=None):
+        if stamp is None:
+            stamp = self.time_source()
+        if event.type == pygame.QUIT:
+            self.running = False
+        elif event.type == pygame.VIDEORESIZE:
+            self.w, self.h = event.w, event.h
+            self.screen = pygame.display.get_surface()
+            self.renderer.resize(self.screen)
+        elif event.type == pygame.VIDEOEXPOSE:
+            self.renderer.invalidate()
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            self.profiler.toggle_overlay()
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            if self.game_state == "playing":
+                if not self.active and not self.show_results and not self.game_won:
+                    self.active = True
+                    self.start_time = stamp
+                    self.keylog.start(stamp)
+                elif self.show_results:
+                    self.next_level()
+        elif event.type == pygame.KEYDOWN:
             if self.game_state == "menu":
-                self.draw_menu()
-            elif self.game_state == "leaderboard":
-                self.draw_leaderboard()
+                if event.key == pygame.K_RETURN:
+                    self.difficulty = list(DIFFICULTY_MODES.keys())[self.menu_selection]
+                    self.game_state = "name_entry"
+                    if self.adaptive and self.adaptive_prefetcher is None:
+                        self.open_adaptive()
+                    self.prefetch_level(1)
+                elif event.key == pygame.K_UP:
+                    self.menu_selection = (self.menu_selection - 1) % len(DIFFICULTY_MODES)
+                elif event.key == pygame.K_DOWN:
+                    self.menu_selection = (self.menu_selection + 1) % len(DIFFICULTY_MODES)
+                elif event.key == pygame.K_l:
+                    self.game_state = "leaderboard"
+                elif event.key == pygame.K_SPACE:
+                    self.sounds_muted = True
+                elif event.key == pygame.K_m:
+                    self.typing_mode = "aligned" if self.typing_mode == "strict" else "strict"
+                elif event.key == pygame.K_a:
+                    self.adaptive = not self.adaptive
+                self.play_sound(self.click_sound)
+                
             elif self.game_state == "name_entry":
-                self.draw_name_entry()
+                if event.key == pygame.K_RETURN and self.player_name.strip():
+                    self.game_state = "playing"
+                    self.typing = TypingState(mode=self.typing_mode)
+                    self.load_level(1)
+                    self.game_won = False
+                    self.total_score = 0
+                    self.stars_count = 0
+                elif event.key == pygame.K_BACKSPACE:
+                    self.player_name = self.player_name[:-1]
+                elif event.key != pygame.K_ESCAPE and len(self.player_name) < MAX_NAME_LENGTH:
+                    self.player_name += event.unicode
+                    
             elif self.game_state == "playing":
-                self.draw_centered_text(f"Level {self.level}/{self.max_level} | {self.difficulty} ⭐{self.stars_count}", 60, self.heading_color, self.big_font)
-                
                 if self.active and not self.show_results:
-                    time_elapsed = time.time() - self.start_time
-                    time_left = max(0, self.time_limit - time_elapsed)
-                    self.draw_centered_text(f"Time: {time_left:.1f}s | Goal: {self.req_acc:.0f}% | Score: {self.total_score}", 110, self.text_color)
-                else:
-                    self.draw_centered_text(f"Goal: {self.req_acc:.0f}% accuracy | Score: {self.total_score}", 110, self.text_color)
-                
-                self.draw_text("Type exactly:", 50, 170, self.text_color)
-                self.draw_sentence_highlighted(50, 210)
-                
-                pygame.draw.rect(self.screen, self.glow_color, (50, 500, 1100, 60), 4)
-                input_display = self.input_text if self.input_text else "Click to unleash your typing power..."
-                self.draw_text(input_display, 70, 520, self.text_color)
-                
-                self.draw_text("ENTER=FINISH | Backspace OKAY | Click results to LEVEL UP! | ESC=Menu", 50, 700, (200, 255, 200), self.small_font)
-                
-                if self.show_results:
-                    overlay = pygame.Surface((self.w, self.h))
-                    overlay.set_alpha(220)
-                    overlay.fill((15, 30, 70))
-                    self.screen.blit(overlay, (0, 0))
-                    
-                    self.draw_centered_text(f"🎉 LEVEL {self.level} CRUSHED! 🎉", self.h//2 - 140, self.heading_color, self.title_font)
-                    self.draw_centered_text(self.motivation_msg, self.h//2 - 80, self.glow_color, self.big_font)
-                    self.draw_centered_text(f"Accuracy: {self.accuracy:.1f}%", self.h//2 - 20, self.correct_color)
-                    self.draw_centered_text(f"WPM: {self.wpm:.1f}", self.h//2 + 30, self.correct_color)
-                    self.draw_centered_text(f"Time: {self.time_used:.1f}s (+{self.calculate_score()}pts)", self.h//2 + 80, self.correct_color)
-                    self.draw_centered_text("👆 CLICK TO DOMINATE NEXT LEVEL 👆", self.h//2 + 160, self.glow_color)
-                
-                elif self.game_won:
-                    overlay = pygame.Surface((self.w, self.h))
-                    overlay.set_alpha(240)
-                    overlay.fill((20, 20, 60))
-                    self.screen.blit(overlay, (0, 0))
-                    
-                    for i in range(5):
-                        pygame.draw.circle(self.screen, self.trophy_gold, 
-                                         (self.w//2 + i*30 - 120, self.h//2 - 150), 40 + i*5)
-                    
-                    self.draw_centered_text("🏆🏆🏆 TYPING LEGEND! 🏆🏆🏆", self.h//2 - 120, self.trophy_gold, self.title_font)
-                    self.draw_centered_text(f"{self.player_name} - {self.total_score}pts", self.h//2 - 50, self.heading_color, self.big_font)
-                    self.draw_centered_text(f"{self.difficulty} Mode ⭐{self.stars_count}", self.h//2 + 20, self.glow_color)
-                    self.draw_centered_text("ESC = Main Menu", self.h//2 + 140, (0, 255, 255))
-            
-            self.update_particles()
-            self.draw_particles()
-            pygame.display.flip()
-            self.clock.tick(60)
+                    if event.key == pygame.K_RETURN:
+                        self.check_level_complete(stamp)
+                    elif event.key == pygame.K_BACKSPACE:
+                        type_key(self.typing, self.keylog, BACKSPACE, stamp)
+                        self.play_sound(self.click_sound)
+                    elif event.unicode:
+                        type_key(self.typing, self.keylog, event.unicode, stamp)
+                        self.play_sound(self.click_sound)
+            elif self.game_state == "leaderboard" and event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                step = 1 if event.key == pygame.K_RIGHT else -1
+                i = LEADERBOARD_FILTERS.index(self.leaderboard_filter)
+                self.leaderboard_filter = LEADERBOARD_FILTERS[(i + step) % len(LEADERBOARD_FILTERS)]
+            elif event.key == pygame.K_ESCAPE:
+                if self.game_state in ["playing", "game_won", "leaderboard", "name_entry"]:
+                    self.game_state = "menu"
+                    self.menu_selection = 1
+
+    def render_frame(self):
+        if not self.startup_reported:
+            self.startup_reported = True
+            self.record_startup("first frame")
+            if self.report_startup:
+                print(self.startup_report())
+        self.draw_frame()
+        self.update_particles()
+        self.draw_particles()
+        self.renderer.sprites(self.profiler.draw(self.screen, self.text_cache, self.small_font))
+        with self.profiler.phase("present"):
+            self.renderer.present()
+
+    @profiled
+    def draw_frame(self):
+        """Draw the current screen through the layer cache"""
+        header = self.header_text()
+        if self.game_state == "menu":
+            self.renderer.begin(("menu", header, self.menu_selection, self.typing_mode, self.adaptive), self.draw_menu)
+        elif self.game_state == "leaderboard":
+            self.poll_high_scores()
+            key = ("leaderboard", header, self.scores_version, self.leaderboard_filter)
+            self.renderer.begin(key, self.draw_leaderboard)
+        elif self.game_state == "name_entry":
+            self.renderer.begin(("name_entry", header, self.difficulty, self.player_name), self.draw_name_entry)
+        elif self.game_state == "playing":
+            if self.show_results:
+                key = ("results", header, self.level, self.difficulty, self.stars_count,
+                       self.motivation_msg, self.accuracy, self.wpm, self.time_used)
+                self.renderer.begin(key, self.draw_results)
+            elif self.game_won:
+                key = ("game_won", header, self.level, self.difficulty, self.stars_count, self.typing.revision)
+                self.renderer.begin(key, self.draw_game_won)
+            else:
+                key = ("playing", header, self.level, self.difficulty, self.stars_count)
+                self.renderer.begin(key, self.draw_playing)
+                self.renderer.widget("status", self.status_text(), self.draw_status)
+                self.renderer.widget("sentence", self.typing.revision, lambda: self.draw_sentence_highlighted(50, 210))
+                self.renderer.widget("input", self.typing.revision, self.draw_input)
 
 if __name__ == '__main__':
     try:
-        if 'np' not in globals():
+        if importlib.util.find_spec("numpy") is None:
             print("Install numpy for sound effects: pip install numpy")
-        game = TypingTest()
+        game = TypingTest(fast_start=True if "--fast-start" in sys.argv else None)
         game.run()
     finally:
         pygame.quit()
@@ -0,0 +1,242 @@
+from array import array
+
+PENDING = 0
+CORRECT = 1
+WRONG = 2
+
+# How far (in characters) the aligned mode may drift from the strict position
+ALIGN_WINDOW = 8
+
+_INF = 1 << 30
+_DIAG, _LEFT, _UP = 1, 2, 3
+
+
+class TypingState:
+    """Typed text against a target sentence, updated in O(1) per keystroke.
+
+    In "strict" mode typed character i is compared with target character i,
+    exactly like the original per-frame scan. In "aligned" mode each
+    keystroke extends a banded edit-distance table (window ALIGN_WINDOW), so a
+    dropped or doubled character only costs one error instead of marking the
+    rest of the line wrong. A typed character the alignment skips is an
+    extra error: it counts against accuracy. The marks depend only on the
+    text typed, not on how it was edited.
+    """
+
+    def __init__(self, target="", mode="strict", window=ALIGN_WINDOW):
+        if mode not in ("strict", "aligned"):
+            raise ValueError(f"Unknown typing mode: {mode}")
+        self.mode = mode
+        self.window = window
+        # Bumped on every change so renderers can tell when to redraw
+        self.revision = 0
+        self.reset(target)
+
+    def reset(self, target=None):
+        if target is not None:
+            self.target = target
+        self.typed = []
+        self.status = bytearray(len(self.target))
+        self.correct = 0
+        self.incorrect = 0
+        # Typed characters the alignment matched to no target character
+        self.extra = 0
+        self._text = ""
+        self._text_valid = True
+        self.revision += 1
+        if self.mode == "aligned":
+            self._marked_end = 0
+            self._rows = [self._first_row()]
+            # The last traceback, per row: the target positions it passed
+            # through (entering at hi, leaving at lo) and the UP moves on it
+            # from this row down
+            self._path_lo = array('i', [0])
+            self._path_hi = array('i', [0])
+            self._path_ups = array('i', [0])
+
+    def __len__(self):
+        return len(self.typed)
+
+    @property
+    def text(self):
+        if not self._text_valid:
+            self._text = "".join(self.typed)
+            self._text_valid = True
+        return self._text
+
+    @property
+    def accuracy(self):
+        total = len(self.target) + self.extra
+        return (self.correct / total) * 100 if total else 0
+
+    @property
+    def cursor(self):
+        """Target position the next keystroke is expected to match"""
+        if self.mode == "aligned":
+            return self._marked_end
+        return min(len(self.typed), len(self.target))
+
+    def type_char(self, char):
+        self.typed.append(char)
+        self._text_valid = False
+        self.revision += 1
+        if self.mode == "aligned":
+            self._rows.append(self._next_row(char))
+            self._path_lo.append(-1)
+            self._path_hi.append(-1)
+            self._path_ups.append(0)
+            self._realign()
+            return
+        pos = len(self.typed) - 1
+        if pos < len(self.target):
+            self._set(pos, CORRECT if self.target[pos] == char else WRONG)
+
+    def backspace(self):
+        if not self.typed:
+            return
+        self.typed.pop()
+        self._text_valid = False
+        self.revision += 1
+        if self.mode == "aligned":
+            self._rows.pop()
+            self._path_lo.pop()
+            self._path_hi.pop()
+            self._path_ups.pop()
+            self._realign()
+            return
+        pos = len(self.typed)
+        if pos < len(self.target):
+            self._set(pos, PENDING)
+
+    def _set(self, pos, value):
+        old = self.status[pos]
+        if old == value:
+            return
+        if old == CORRECT:
+            self.correct -= 1
+        elif old == WRONG:
+            self.incorrect -= 1
+        if value == CORRECT:
+            self.correct += 1
+        elif value == WRONG:
+            self.incorrect += 1
+        self.status[pos] = value
+
+    # Aligned mode: one banded DP row per typed prefix, each row is
+    # (lo, costs, moves) covering target positions lo..lo+len(costs)-1.
+
+    def _band(self, i):
+        n = len(self.target)
+        lo = min(max(0, i - self.window), n)
+        hi = max(min(n, i + self.window), lo)
+        return lo, hi
+
+    def _first_row(self):
+        lo, hi = self._band(0)
+        costs = array('i', range(lo, hi + 1))
+        moves = array('b', [0] + [_LEFT] * (hi - lo))
+        return lo, costs, moves
+
+    def _next_row(self, char):
+        prev_lo, prev_costs, _ = self._rows[-1]
+        prev_hi = prev_lo + len(prev_costs) - 1
+        lo, hi = self._band(len(self.typed))
+        target = self.target
+        costs = array('i', [_INF]) * (hi - lo + 1)
+        moves = array('b', bytes(hi - lo + 1))
+        for j in range(lo, hi + 1):
+            best, move = _INF, 0
+            if prev_lo <= j - 1 <= prev_hi:
+                best = prev_costs[j - 1 - prev_lo] + (target[j - 1] != char)
+                move = _DIAG
+            if j > lo and costs[j - 1 - lo] + 1 < best:
+                best, move = costs[j - 1 - lo] + 1, _LEFT
+            if prev_lo <= j <= prev_hi and prev_costs[j - prev_lo] + 1 < best:
+                best, move = prev_costs[j - prev_lo] + 1, _UP
+            costs[j - lo] = best
+            moves[j - lo] = move
+        return lo, costs, moves
+
+    def _best_end(self):
+        """Cheapest target position for the typed prefix, preferring a match"""
+        i = len(self.typed)
+        lo, costs, moves = self._rows[-1]
+        best_key, best_j = None, lo
+        for k, cost in enumerate(costs):
+            j = lo + k
+            matched = moves[k] == _DIAG and i > 0 and self.target[j - 1] == self.typed[-1]
+            key = (cost, not matched, abs(j - i))
+            if best_key is None or key < best_key:
+                best_key, best_j = key, j
+        return best_j
+
+    def _realign(self):
+        end = self._best_end()
+        for pos in range(end, self._marked_end):
+            self._set(pos, PENDING)
+        self._marked_end = end
+        # Trace back until the path reaches a cell of the previous traceback:
+        # from there down the two are the same, and so are their marks. After
+        # a keystroke that is usually the next row; after a backspace the new
+        # path may differ all the way down.
+        path_lo, path_hi, path_ups = self._path_lo, self._path_hi, self._path_ups
+        i, j = len(self.typed), end
+        entry = j
+        # UP flag of each row left on the way down, from the top
+        left_up = []
+        while not path_lo[i] <= j <= path_hi[i]:
+            lo, _, moves = self._rows[i]
+            if not lo <= j < lo + len(moves):
+                break
+            move = moves[j - lo]
+            if move == _LEFT:
+                self._set(j - 1, WRONG)
+                j -= 1
+                continue
+            path_lo[i], path_hi[i] = j, entry
+            if move == _DIAG:
+                self._set(j - 1, CORRECT if self.target[j - 1] == self.typed[i - 1] else WRONG)
+                j -= 1
+            elif move != _UP:
+                break
+            left_up.append(move == _UP)
+            i -= 1
+            entry = j
+        else:
+            path_hi[i] = entry
+        for row in range(i + 1, i + 1 + len(left_up)):
+            path_ups[row] = path_ups[row - 1] + left_up[-(row - i)]
+        self.extra = path_ups[len(self.typed)]
+
+
+def check(rounds=2000, seed=0):
+    """Fuzz aligned mode: typing with backspaces must leave the same marks as
+    typing the final text fresh. Returns the first mismatch, or None."""
+    import random
+    rng = random.Random(seed)
+    for _ in range(rounds):
+        target = "".join(rng.choice("ab ") for _ in range(rng.randint(0, 30)))
+        keys = "".join(rng.choice("ab \b") for _ in range(rng.randint(0, 40)))
+        typing = TypingState(target, mode="aligned")
+        for key in keys:
+            if key == "\b":
+                typing.backspace()
+            else:
+                typing.type_char(key)
+        fresh = TypingState(target, mode="aligned")
+        for char in typing.text:
+            fresh.type_char(char)
+        got = (bytes(typing.status), typing.correct, typing.incorrect, typing.extra, typing.cursor)
+        want = (bytes(fresh.status), fresh.correct, fresh.incorrect, fresh.extra, fresh.cursor)
+        if got != want:
+            return target, keys, got, want
+    return None
+
+
+if __name__ == "__main__":
+    import sys
+    mismatch = check(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
+    if mismatch:
+        print("Incremental and fresh alignment differ: target=%r keys=%r\n  got  %r\n  want %r" % mismatch)
+        sys.exit(1)
+    print("Aligned mode matches a fresh replay")